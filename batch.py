@@ -0,0 +1,228 @@
+# Batch mode: fill one document per shipment record without the GUI.
+#
+#   document_filler batch --template filldoc.docx --data shipments.jsonl --out dir/
+#
+# Records are streamed from JSON lines or CSV, so the manifest is never held in
+# memory. A JSON line looks like
+#   {"name": "...", "cons_id": "...", "flight": "AT201",
+#    "boxes": [{"tag": "...", "description": "..."}], "date": "optional"}
+# and a CSV file has name, cons_id, flight and optional date columns followed by
+# tag1, description1, tag2, description2, ... columns.
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import docx_writer
+import fill_engine
+import instrumentation
+import profiling
+
+
+# Longest name + flight part of an output file name
+MAX_LABEL = 80
+
+
+class RecordError(ValueError):
+    """ A line of the data file that cannot be read as a shipment record """
+
+
+def _csv_record(row):
+    boxes = []
+    i = 1
+    while row.get(f"tag{i}") or row.get(f"description{i}"):
+        boxes.append({"tag": row.get(f"tag{i}") or "", "description": row.get(f"description{i}") or ""})
+        i += 1
+    return {
+        "name": row["name"],
+        "cons_id": row["cons_id"],
+        "flight": row["flight"],
+        "date": row.get("date") or None,
+        "boxes": boxes,
+    }
+
+
+def read_records(data_path):
+    """ Yield shipment records one at a time from a .jsonl or .csv file. A line
+    that cannot be read is yielded as a RecordError, so it fails on its own
+    instead of ending the run. """
+    if data_path.lower().endswith(".csv"):
+        with open(data_path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                try:
+                    yield _csv_record(row)
+                except KeyError as e:
+                    yield RecordError(f"line {reader.line_num}: no {e.args[0]} column")
+    else:
+        # Bytes, so a badly encoded line is that line's error only
+        with open(data_path, "rb") as f:
+            for line_num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield RecordError(f"line {line_num}: {e}")
+                    continue
+                if isinstance(record, dict):
+                    yield record
+                else:
+                    yield RecordError(f"line {line_num}: expected a JSON object, got {type(record).__name__}")
+
+
+def output_name(index, record):
+    """ Unique, filesystem-safe file name for the index-th record """
+    label = re.sub(r"[^\w.-]+", "_", f"{record.get('name', '')}_{record.get('flight', '')}").strip("_")
+    return f"{index:06d}_{label[:MAX_LABEL]}.docx"
+
+
+# Compiled template used by worker processes. With the fork start method it is
+# inherited copy-on-write from the parent; otherwise each worker compiles it
+# once from the template bytes passed to the initializer.
+_template = None
+
+
+def _init_worker(template_path, template_data):
+    global _template
+    instrumentation.install_from_env()
+    if _template is None:
+        _template = fill_engine.CompiledTemplate(template_path, template_data)
+
+
+def _render_chunk(template, out_dir, compresslevel, chunk):
+    """ Render a chunk of (index, record) pairs; returns (pid, rendered, failures, busy seconds) """
+    start = time.perf_counter()
+    failures = []
+    for index, record in chunk:
+        try:
+            if isinstance(record, RecordError):
+                raise record
+            output_path = os.path.join(out_dir, output_name(index, record))
+            template.render(fill_engine.record_word_list(record), output_path, compresslevel)
+        except (KeyError, TypeError, AttributeError, ValueError, OSError) as e:
+            # RecordError and fill_engine.TemplateError are ValueErrors
+            failures.append((index, repr(e)))
+    return os.getpid(), len(chunk), failures, time.perf_counter() - start
+
+
+def _render_chunk_in_worker(out_dir, compresslevel, chunk):
+    return _render_chunk(_template, out_dir, compresslevel, chunk)
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch(template, data_path, out_dir, compresslevel=docx_writer.DEFAULT_COMPRESS_LEVEL, workers=1, chunk_size=32):
+    """ Fill one document per record.
+
+    Returns (written, failed, elapsed seconds, per-worker stats) where the stats
+    map each worker pid to (documents, busy seconds).
+    """
+    global _template
+    os.makedirs(out_dir, exist_ok=True)
+    written = failed = 0
+    worker_stats = {}
+    start = time.perf_counter()
+    # The template is parsed once and every record reuses its render plan
+    compiled = fill_engine.compile_template(template)
+    records = _chunks(enumerate(read_records(data_path), 1), chunk_size)
+
+    def collect(result):
+        nonlocal written, failed
+        pid, rendered, failures, busy = result
+        written += rendered - len(failures)
+        failed += len(failures)
+        docs, seconds = worker_stats.get(pid, (0, 0.0))
+        worker_stats[pid] = (docs + rendered, seconds + busy)
+        for index, error in failures:
+            print(f"record {index}: {error}", file=sys.stderr)
+
+    if workers <= 1:
+        for chunk in records:
+            collect(_render_chunk(compiled, out_dir, compresslevel, chunk))
+        return written, failed, time.perf_counter() - start, worker_stats
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+        _template = compiled
+    else:
+        context = multiprocessing.get_context()
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(compiled.path, compiled.data)) as executor:
+            # Keep a bounded number of chunks in flight so records stay streamed
+            pending = set()
+            for chunk in records:
+                pending.add(executor.submit(_render_chunk_in_worker, out_dir, compresslevel, chunk))
+                if len(pending) >= workers * 4:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future.result())
+            for future in wait(pending).done:
+                collect(future.result())
+    finally:
+        _template = None
+    return written, failed, time.perf_counter() - start, worker_stats
+
+
+def report(written, failed, elapsed, worker_stats=None):
+    rate = written / elapsed if elapsed else 0.0
+    print(f"{written} documents written, {failed} failed in {elapsed:.2f} s ({rate:.1f} docs/s)")
+    if worker_stats and len(worker_stats) > 1:
+        for pid, (docs, busy) in sorted(worker_stats.items()):
+            print(f"  worker {pid}: {docs} records ({docs / busy if busy else 0.0:.1f} docs/s)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="document_filler batch", description="Fill one document per shipment record.")
+    parser.add_argument("--template", required=True, help="template .docx")
+    parser.add_argument("--data", required=True, help="shipment records (.jsonl or .csv)")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--compress-level", type=int, default=docx_writer.DEFAULT_COMPRESS_LEVEL, choices=range(10),
+                        metavar="0-9", help="deflate level for the filled parts, 0 to store them uncompressed")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=32, help="records sent to a worker at a time")
+    parser.add_argument("--spans", help="append stage timing spans to this JSON lines file")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile the run in-process and write batch.prof and batch.collapsed.txt to --out")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.spans:
+        # Through the environment so spawned worker processes export too
+        os.environ[instrumentation.SPANS_ENV] = args.spans
+    instrumentation.install_from_env()
+    if args.profile or profiling.requested():
+        # Render in this process so the profile sees the fill work, not the pool
+        os.makedirs(args.out, exist_ok=True)
+        with profiling.profile(os.path.join(args.out, "batch")):
+            written, failed, elapsed, worker_stats = run_batch(
+                args.template, args.data, args.out, args.compress_level, 1, args.chunk_size,
+            )
+    else:
+        written, failed, elapsed, worker_stats = run_batch(
+            args.template, args.data, args.out, args.compress_level, args.workers, args.chunk_size,
+        )
+    report(written, failed, elapsed, worker_stats)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# Open latency of the option dropdowns.
+#
+#   python benchmarks/bench_dropdown.py
+#
+# Opens an OptionDropDown over 10k and 100k options (and, for comparison, a
+# plain DropDown with one Button per option for the smaller sizes) and prints
+# the time until the first frame showing it has been drawn. It then times
+# reopening the OptionDropDown after one option moved to the head of the list,
+# as happens when a letter using it is submitted.
+import os
+import sys
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kivy.base import EventLoop
+from kivy.clock import Clock
+from kivy.core.window import Window
+from kivy.uix.button import Button
+from kivy.uix.dropdown import DropDown
+from kivy.uix.textinput import TextInput
+
+from widgets import OptionDropDown
+
+SIZES = (10_000, 100_000)
+LEGACY_SIZES = (1_000, 10_000)
+
+
+def open_virtual(anchor, options):
+    dropdown = OptionDropDown()
+    dropdown.set_options(options)
+    dropdown.open(anchor)
+    return dropdown
+
+
+def open_legacy(anchor, options):
+    dropdown = DropDown()
+    for option in options:
+        dropdown.add_widget(Button(text=option, size_hint_y=None, height=44))
+    dropdown.open(anchor)
+    return dropdown
+
+
+def time_open(opener, anchor, options):
+    start = time.perf_counter()
+    dropdown = opener(anchor, options)
+    # Lay out and draw the frame that shows the dropdown
+    Clock.tick()
+    EventLoop.idle()
+    elapsed = time.perf_counter() - start
+    # Rows actually drawn, so an empty list is not timed by mistake
+    container = dropdown.list_view.layout_manager if isinstance(dropdown, OptionDropDown) else dropdown.container
+    rows = len(container.children)
+    dropdown.dismiss()
+    Clock.tick()
+    return elapsed, rows
+
+
+def time_reorder(anchor, options):
+    dropdown = open_virtual(anchor, options)
+    Clock.tick()
+    EventLoop.idle()
+    dropdown.dismiss()
+    Clock.tick()
+    used = options[len(options) // 100]
+    start = time.perf_counter()
+    dropdown.set_options([used] + [option for option in options if option != used])
+    dropdown.open(anchor)
+    Clock.tick()
+    EventLoop.idle()
+    elapsed = time.perf_counter() - start
+    dropdown.dismiss()
+    Clock.tick()
+    return elapsed
+
+
+def main():
+    EventLoop.ensure_window()
+    anchor = TextInput(size_hint=(None, None), size=(540, 50), pos=(30, Window.height - 100))
+    Window.add_widget(anchor)
+    Clock.tick()
+    for size in SIZES:
+        options = [f"Option {i}" for i in range(size)]
+        elapsed, rows = time_open(open_virtual, anchor, options)
+        print(f"OptionDropDown {size:>7} options: {elapsed * 1000:8.1f} ms ({rows} row widgets)")
+        elapsed = time_reorder(anchor, options)
+        print(f"  reordered head           : {elapsed * 1000:8.1f} ms")
+    for size in LEGACY_SIZES:
+        options = [f"Option {i}" for i in range(size)]
+        elapsed, rows = time_open(open_legacy, anchor, options)
+        print(f"DropDown       {size:>7} options: {elapsed * 1000:8.1f} ms ({rows} row widgets)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# Benchmark suite for the fill pipeline, with regression baselines.
+#
+#   python benchmarks/bench_fill.py                      # run, compare with baseline.json
+#   python benchmarks/bench_fill.py --out results.json   # also keep the results
+#   python benchmarks/bench_fill.py --update-baseline    # store the results as the baseline
+#
+# Synthetic templates of 1 to 200 pages, 0 to 5,000 table rows and several
+# header images are generated in a temporary directory, and each stage of a
+# fill is timed on its own: load (parse and compile), substitute, table growth
+# and save. The run fails when a stage is slower than its baseline by more
+# than --threshold (default 75%: reruns on a shared machine have come out up
+# to 58% slower with no code change) and by more than NOISE_FLOOR. Baselines
+# are machine specific; refresh them with --update-baseline after moving to
+# another machine.
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import random
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document
+from docx.enum.text import WD_BREAK
+from docx.shared import Inches
+
+import fill_engine
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+STAGES = ("load", "substitute", "table", "save")
+
+# name: (pages, table rows, header images)
+CASES = {
+    "no_boxes": (1, 0, 1),
+    "letter": (1, 1, 1),
+    "letter_many_images": (1, 6, 4),
+    "long_table": (1, 5000, 1),
+    "medium": (20, 500, 2),
+    "long_document": (200, 10, 3),
+}
+
+# Regressions smaller than this are treated as timer noise
+NOISE_FLOOR = 0.0005
+
+
+def _png(width, height, seed):
+    """ A noisy (so barely compressible) RGB PNG """
+    rng = random.Random(seed)
+    raw = b"".join(b"\0" + rng.randbytes(width * 3) for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">2I5B", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+def make_template(path, pages, images):
+    document = Document()
+    header = document.sections[0].header.paragraphs[0]
+    for i in range(images):
+        header.add_run().add_picture(io.BytesIO(_png(160, 160, i)), width=Inches(0.6))
+    header.add_run("Header for {name}")
+
+    document.add_paragraph("{date}")
+    document.add_paragraph("We would like to inform you that MR. {name} with Cons Id # {cons_id} "
+                           "will be handing over {boxes} on today's flight {flight}.")
+    table = document.add_table(rows=1, cols=2)
+    table.rows[0].cells[0].text = "Tag"
+    table.rows[0].cells[1].text = "Descriptions"
+    for page in range(pages - 1):
+        paragraph = None
+        for line in range(40):
+            paragraph = document.add_paragraph(f"Page {page + 2}, line {line + 1}: filler text for the benchmark.")
+        paragraph.add_run().add_break(WD_BREAK.PAGE)
+    document.save(path)
+
+
+def time_case(path, rows, repeat):
+    boxes = [(f"Tag {i}", f"Diplomatic box# {i}") for i in range(rows)]
+    word_list = fill_engine.make_word_list("Name", "0000-0000-00", "AT201", boxes, date="January 01, 2025")
+    timings = {stage: [] for stage in STAGES}
+    for _ in range(repeat):
+        # Collect between runs and not during the timed stages
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter()
+        template = fill_engine.CompiledTemplate(path)
+        timings["load"].append(time.perf_counter() - start)
+
+        num_boxes = template.check_word_list(word_list)
+        start = time.perf_counter()
+        stories = template.substitute(word_list, num_boxes)
+        timings["substitute"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        template.grow_table(stories, word_list, num_boxes)
+        timings["table"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        template.save(stories, io.BytesIO())
+        timings["save"].append(time.perf_counter() - start)
+
+        gc.enable()
+        # Free the trees now rather than inside the next timed stage
+        del template, stories
+    # The fastest run is the least disturbed by the rest of the machine
+    return {stage: min(values) for stage, values in timings.items()}
+
+
+def run(repeat, cases):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in cases:
+            pages, rows, images = CASES[name]
+            path = os.path.join(directory, f"{name}.docx")
+            make_template(path, pages, images)
+            results[name] = time_case(path, rows, repeat)
+            print(f"{name:<20}" + "".join(f" {stage} {results[name][stage] * 1000:8.2f} ms" for stage in STAGES))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """ Return a message for every stage slower than its baseline by more than threshold """
+    regressions = []
+    for name, stages in results.items():
+        for stage, seconds in stages.items():
+            reference = baseline.get(name, {}).get(stage)
+            if reference is None:
+                continue
+            if seconds > reference * (1 + threshold) and seconds - reference > NOISE_FLOOR:
+                regressions.append(f"{name}/{stage}: {seconds * 1000:.2f} ms vs baseline {reference * 1000:.2f} ms "
+                                   f"(+{(seconds / reference - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the fill pipeline stage by stage.")
+    parser.add_argument("--repeat", type=int, default=7, help="runs per case, the fastest is kept")
+    parser.add_argument("--case", action="append", choices=sorted(CASES), help="run only this case (repeatable)")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare with")
+    parser.add_argument("--threshold", type=float, default=0.75, help="allowed slowdown, 0.75 = 75%%")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat, args.case or list(CASES))
+    report = {"python": platform.python_version(), "machine": platform.machine(), "cases": results}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=4)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)["cases"]
+    regressions = compare(results, baseline, args.threshold)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
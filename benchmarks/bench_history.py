@@ -0,0 +1,72 @@
+# Latency of the letter history.
+#
+#   python benchmarks/bench_history.py
+#
+# Records 100k letters with the example template into a fresh database and
+# prints the time to record one, to fetch one by id, to look letters up by
+# the start of a name, consular ID or flight and by day, and to regenerate
+# one into memory.
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fill_engine
+from history import LetterHistory
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "filldoc.docx")
+SIZE = 100_000
+REPEAT = 500
+
+FIRST_NAMES = ["Fannan", "Hassan", "Mohammed", "Youssef", "Karim", "Amine", "Omar", "Rachid", "Nadia", "Fatima"]
+
+
+def median_us(function, repeat=REPEAT):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e6
+
+
+def word_list(rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    name = f"{rng.choice(FIRST_NAMES)} {''.join(rng.choice(letters) for _ in range(8)).title()}"
+    cons_id = f"{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}-{rng.randint(10, 99)}"
+    boxes = [(f"Tag {i}", f"Diplomatic box# {i}") for i in range(1, rng.randint(1, 6) + 1)]
+    return fill_engine.make_word_list(name, cons_id, rng.choice(["AT201", "AT203", "AT205"]), boxes)
+
+
+def main():
+    rng = random.Random(0)
+    template = fill_engine.compile_template(TEMPLATE)
+    timings = {"substitute": 0.0005, "table": 0.0001, "save": 0.002, "total": 0.003}
+    with tempfile.TemporaryDirectory() as directory:
+        history = LetterHistory(os.path.join(directory, "history.sqlite3"))
+        now = time.time()
+        start = time.perf_counter()
+        # A letter every few minutes, going back about a year
+        for i in range(SIZE):
+            history.record(word_list(rng), template, "out.docx", timings, created=now - (SIZE - i) * 300)
+        print(f"{SIZE} letters recorded in {time.perf_counter() - start:.1f} s")
+
+        day = history.get(SIZE // 2)["day"]
+        print(f"  record one        median {median_us(lambda: history.record(word_list(rng), template, 'out.docx', timings)):8.1f} us")
+        print(f"  get by id         median {median_us(lambda: history.get(rng.randint(1, SIZE))):8.1f} us")
+        for query in ("hassan k", "4966-7", "AT203"):
+            print(f"  find {query!r:<12} median {median_us(lambda: history.find(query, limit=20)):8.1f} us")
+        print(f"  find day          median {median_us(lambda: history.find(day=day, limit=20)):8.1f} us")
+        letter = history.get(SIZE // 2)
+        regenerate = lambda: history.template(letter).render_bytes(
+            fill_engine.make_word_list(letter["name"], letter["cons_id"], letter["flight"], letter["boxes"], letter["date"]))
+        print(f"  regenerate        median {median_us(regenerate, 50) / 1000:8.1f} ms")
+        history.close()
+
+
+if __name__ == "__main__":
+    main()
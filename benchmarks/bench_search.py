@@ -0,0 +1,64 @@
+# Latency of the type-ahead option search.
+#
+#   python benchmarks/bench_search.py
+#
+# Builds an OptionIndex over 100k synthetic names and consular IDs and prints
+# the build time, then the median and 99th percentile search time for each
+# query as it is typed one keystroke at a time.
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from option_index import OptionIndex
+
+SIZE = 100_000
+REPEAT = 200
+LIMIT = 20
+
+FIRST_NAMES = ["Fannan", "Hassan", "Mohammed", "Youssef", "Karim", "Amine", "Omar", "Rachid", "Nadia", "Fatima"]
+
+
+def names(rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return [f"{rng.choice(FIRST_NAMES)} {''.join(rng.choice(letters) for _ in range(rng.randint(5, 10))).title()}"
+            for _ in range(SIZE)]
+
+
+def cons_ids(rng):
+    return [f"{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}-{rng.randint(10, 99)}" for _ in range(SIZE)]
+
+
+def time_queries(index, text):
+    """ Search every prefix of text, as the field sees it while typing """
+    timings = []
+    for end in range(1, len(text) + 1):
+        query = text[:end]
+        index.search(query, LIMIT)  # the first 1-2 character search builds its posting list
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            index.search(query, LIMIT)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    rng = random.Random(0)
+    for label, options, typed in (
+        ("names", names(rng), ["hassan k", "ssan", "zqx"]),
+        ("cons ids", cons_ids(rng), ["4966-77", "-53", "99-1"]),
+    ):
+        start = time.perf_counter()
+        index = OptionIndex(options)
+        print(f"{label}: {len(index)} options indexed in {(time.perf_counter() - start) * 1000:.0f} ms")
+        for text in typed:
+            timings = time_queries(index, text)
+            print(f"  typing {text!r:<12} median {statistics.median(timings) * 1e6:7.1f} us"
+                  f"  p99 {statistics.quantiles(timings, n=100)[98] * 1e6:7.1f} us")
+
+
+if __name__ == "__main__":
+    main()
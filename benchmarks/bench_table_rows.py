@@ -0,0 +1,42 @@
+# Per-row cost of growing the box table.
+#
+#   python benchmarks/bench_table_rows.py [template.docx]
+#
+# Fills the template with 0 to 5,000 boxes into memory and prints the time per
+# added row, which should stay roughly constant as the table grows.
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fill_engine
+
+ROW_COUNTS = (0, 10, 100, 1000, 5000)
+
+
+def time_render(template, num_boxes, repeat=3):
+    boxes = [(f"Tag {i}", f"Diplomatic box# {i}") for i in range(num_boxes)]
+    word_list = fill_engine.make_word_list("Name", "0000-0000-00", "AT201", boxes, date="January 01, 2025")
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        template.render(word_list, io.BytesIO())
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv):
+    template_path = argv[0] if argv else os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "filldoc.docx")
+    template = fill_engine.compile_template(template_path)
+    base = time_render(template, 0)
+    print(f"{'rows':>6} {'total ms':>10} {'us/row':>8}")
+    for num_boxes in ROW_COUNTS:
+        elapsed = time_render(template, num_boxes)
+        per_row = (elapsed - base) / num_boxes * 1e6 if num_boxes else 0.0
+        print(f"{num_boxes:>6} {elapsed * 1000:>10.2f} {per_row:>8.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
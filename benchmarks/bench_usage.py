@@ -0,0 +1,59 @@
+# Cost of ranking the dropdown options by use.
+#
+#   python benchmarks/bench_usage.py
+#
+# Over 100k options of which a few thousand have been used, prints the time
+# to count one more use (the ranking is updated in place), to order the list
+# for an empty dropdown and to search with the used options first. For
+# comparison, the last line re-sorts the whole list by decayed count, which
+# is what ordering on every open would cost.
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from option_index import OptionIndex
+from option_usage import UsageRanking
+
+SIZE = 100_000
+USED = 5_000
+USES = 50_000
+REPEAT = 200
+LIMIT = 100
+
+
+def median_us(function, repeat=REPEAT):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e6
+
+
+def main():
+    rng = random.Random(0)
+    options = [f"Name {i:06d}" for i in range(SIZE)]
+    used = rng.sample(options, USED)
+    now = time.time()
+    ranking = UsageRanking()
+    start = time.perf_counter()
+    # A year of letters, the first options used far more often than the last
+    for i in range(USES):
+        ranking.use(used[min(int(rng.expovariate(10 / USED)), USED - 1)], now - 365 * 86400 * (1 - i / USES))
+    print(f"{USES} uses over {len(ranking)} options counted in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    index = OptionIndex(options)
+    print(f"  one more use      median {median_us(lambda: ranking.use(rng.choice(used), now)):9.1f} us")
+    print(f"  order the list    median {median_us(lambda: ranking.order(options), 20):9.1f} us")
+    print(f"  search 'name 01'  median {median_us(lambda: ranking.search(index, 'name 01', LIMIT)):9.1f} us")
+    print(f"  search 'zzz'      median {median_us(lambda: ranking.search(index, 'zzz', LIMIT)):9.1f} us")
+    resort = lambda: sorted(options, key=lambda option: ranking.count(option, now), reverse=True)
+    print(f"  re-sort (naive)   median {median_us(resort, 5):9.1f} us")
+
+
+if __name__ == "__main__":
+    main()
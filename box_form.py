@@ -0,0 +1,57 @@
+# The box details of a letter: one tag and one description per box.
+#
+# The form is kept as plain lists rather than widgets, so it holds any number
+# of boxes while the UI only builds rows for the boxes on screen. The number
+# of empty fields is updated on every change, so checking that the form is
+# complete never walks the boxes.
+
+FIELDS = ("tag", "description")
+
+
+class BoxForm:
+    """ Tags and descriptions of a variable number of boxes """
+
+    def __init__(self, count=0):
+        self.values = {field: [] for field in FIELDS}
+        self.missing = 0
+        self.resize(count)
+
+    def __len__(self):
+        return len(self.values["tag"])
+
+    def resize(self, count):
+        """ Keep the first count boxes, adding empty ones as needed """
+        for values in self.values.values():
+            self.missing -= sum(1 for value in values[count:] if not value)
+            del values[count:]
+            added = count - len(values)
+            values.extend([""] * added)
+            self.missing += added
+
+    def get(self, field, index):
+        return self.values[field][index]
+
+    def set(self, field, index, value):
+        values = self.values[field]
+        self.missing += (not value) - (not values[index])
+        values[index] = value
+
+    def fill(self, field, value, start=0, stop=None):
+        """ Set field to value for boxes start to stop - 1; returns how many were set """
+        values = self.values[field]
+        start = max(start, 0)
+        stop = len(values) if stop is None else min(stop, len(values))
+        if start >= stop:
+            return 0
+        self.missing -= sum(1 for old in values[start:stop] if not old)
+        values[start:stop] = [value] * (stop - start)
+        if not value:
+            self.missing += stop - start
+        return stop - start
+
+    def complete(self):
+        return len(self) > 0 and self.missing == 0
+
+    def boxes(self):
+        """ (tag, description) pairs, in box order """
+        return list(zip(self.values["tag"], self.values["description"]))
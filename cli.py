@@ -0,0 +1,17 @@
+# Headless subcommands of document_filler. Each entry maps a command name to
+# the module providing main(argv); modules are only imported when used, so the
+# GUI start-up does not pay for them.
+import importlib
+
+COMMANDS = {
+    "batch": "batch",
+    "serve": "render_server",
+    "import-options": "import_options",
+    "startup-check": "startup",
+    "history": "history",
+}
+
+
+def main(argv):
+    command, args = argv[0], argv[1:]
+    return importlib.import_module(COMMANDS[command]).main(args)
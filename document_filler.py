@@ -1,40 +1,76 @@
-import datetime
+import importlib
+import multiprocessing
 import os
-import json
+import sys
+import threading
+
+# In the packaged executable, the worker processes of `batch --workers N` and
+# `serve --workers N` are started by running the executable again; this makes
+# them run their task and exit instead of going on to open the UI
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+
+# Start-up stages are timed from here (see startup.py)
+import startup
+
+from concurrent.futures import ThreadPoolExecutor
+
+import cli
+import idle
+import profiling
+
+# Headless subcommands (e.g. `document_filler batch ...`) must run before Kivy
+# is imported, since importing Kivy parses the command line and opens a window
+if __name__ == "__main__" and len(sys.argv) > 1 and sys.argv[1] in cli.COMMANDS:
+    sys.exit(cli.main(sys.argv[1:]))
+
+# Profile every generated document (--profile or DOCUMENT_FILLER_PROFILE=1)
+PROFILE = profiling.requested(sys.argv)
+# Log wakeups, redraws and CPU use (--idle-stats or DOCUMENT_FILLER_IDLE_STATS=1)
+IDLE_STATS = profiling.requested(sys.argv, idle.IDLE_STATS_FLAG, idle.IDLE_STATS_ENV)
+# Set by `document_filler startup-check`: report the start-up and quit on the first frame
+STARTUP_REPORT = os.environ.get(startup.REPORT_ENV)
+startup.mark("python")
+
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
 from kivy.uix.button import Button
-from kivy.uix.dropdown import DropDown
 from kivy.uix.scrollview import ScrollView
 from kivy.core.window import Window
-from kivy.uix.popup import Popup
-from kivy.uix.spinner import Spinner
 from kivy.uix.widget import Widget
 from kivy.graphics import Color, RoundedRectangle
-from kivy.uix.filechooser import FileChooserIconView
 from kivy.clock import Clock
-
-
-
-from docx import Document
-from docx.shared import Pt, RGBColor, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.enum.table import WD_ALIGN_VERTICAL
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
+from kivy.animation import Animation
+startup.mark("kivy")
+
+from box_form import BoxForm
+from idle import IdleStats, IdleThrottle
+from option_index import MERGE_AT, SEARCH_LIMIT, OptionIndex
+from option_usage import OptionUsage
+from options_store import OptionsStore
+from widgets import BoxDetailsView, OptionDropDown, pulse
+
+# Imported on first use, to keep them out of the start-up: fill_engine (and
+# with it python-docx and lxml) is loaded on the worker thread once the first
+# frame is up; import_options, popups, spinners and file choosers when the
+# dialogs needing them open
+import instrumentation
 
 import logging
 from kivy.logger import Logger
-import sys
-import platform
-import subprocess
+startup.mark("app modules")
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 Logger.info("Application started")
 
+# Log how long each stage of a fill takes, and export the spans when
+# DOCUMENT_FILLER_SPANS names a JSON lines file
+instrumentation.add_hook(lambda span: Logger.info(f"Fill stage {span['stage']}: {span['duration'] * 1000:.1f} ms"))
+instrumentation.install_from_env()
+
 # Set window size for a more consistent UI look
 Window.size = (600, 800)
 
@@ -56,101 +92,72 @@ def writable_path(filename):
 # File to store dropdown options (read from the app bundle, write to the home directory)
 OPTIONS_FILE = writable_path('dropdown_options.json')
 
-# Function to load dropdown options
-def load_options():
-    # If the file exists in the writable location, load it from there
-    if os.path.exists(OPTIONS_FILE):
-        with open(OPTIONS_FILE, 'r') as f:
-            return json.load(f)
-    else:
-        # If the file doesn't exist in the writable location, copy it from the app resources
-        default_options = {
-            'NAME_OPTIONS': ["Fannan Mhamed", "El Harbouj Mohammed", "Hassan Laarbi"],
-            'CONS_ID_OPTIONS': ["4966-7777-78", "4025-2450-53", "4028-5586-53"],
-            'FLIGHT_OPTIONS': ["AT201", "AT203"],
-            'TAG_OPTIONS': ["SPSM (Green label)", "Serveurs (Yellow label)", "1005 (white label)"],
-            'DESC_OPTIONS': [f"Diplomatic box# {j}" for j in list(range(1, 11)) + list(range(101, 111))]
-        }
-        # Save default options to the writable location for future use
-        save_options(default_options)
-        return default_options
+# Load options at the start; added items are journaled next to the file
+OPTIONS_STORE = OptionsStore(OPTIONS_FILE)
+OPTIONS = OPTIONS_STORE.load()
+# How often each option went into a letter, lately; dropdowns list the most used first
+OPTION_USAGE = OptionUsage(OPTIONS_FILE + '.usage').load()
+startup.mark("options")
+
+# Option list behind each entry of the "Add New Item" selector
+DROPDOWN_OPTION_KEYS = {
+    'Name': 'NAME_OPTIONS',
+    'Consular ID': 'CONS_ID_OPTIONS',
+    'Flight': 'FLIGHT_OPTIONS',
+    'Tag': 'TAG_OPTIONS',
+    'Description': 'DESC_OPTIONS',
+}
 
-# Function to save dropdown options to the writable location
-def save_options(options):
-    with open(OPTIONS_FILE, 'w') as f:
-        json.dump(options, f, indent=4)
+# Imported options merged into a list per frame
+IMPORT_CHUNK = 5000
 
-# Load options at the start
-OPTIONS = load_options()
+# Largest number of boxes a letter can list
+MAX_BOXES = 5000
 
-# Function that fills the placeholders in the document
-def fill_placeholders(doc_path, output_path, word_list, self):
-    doc = Document(doc_path)
-    placeholder_format = "{placeholder}"
-    boxes_index = 3  # Now the number of boxes is in index 3
+# Every generated letter is kept in this database (see history.py), opened on first use
+HISTORY_FILE = writable_path('document_filler_history.sqlite3')
+_letter_history = None
+_letter_history_lock = threading.Lock()
 
-    # Try to extract the number of boxes
+
+def letter_history():
+    global _letter_history
+    with _letter_history_lock:
+        if _letter_history is None:
+            import history
+
+            _letter_history = history.LetterHistory(HISTORY_FILE)
+        return _letter_history
+
+
+# Runs on the worker thread; with profiling on, the .prof and collapsed stacks
+# are written next to the generated document
+def generate_document(input_doc, output_doc, word_list):
+    import sqlite3
+
+    import fill_engine
+    import history
+
+    with history.timed_stages() as timings:
+        if PROFILE:
+            with profiling.profile(os.path.splitext(output_doc)[0]):
+                fill_engine.fill_placeholders(input_doc, output_doc, word_list)
+        else:
+            fill_engine.fill_placeholders(input_doc, output_doc, word_list)
+
+    # The letter is written; failing to remember it must not fail the job
     try:
-        num_boxes = int(word_list[boxes_index])  # Convert the number of boxes to an integer
-    except ValueError:
-        raise ValueError(f"Expected an integer for number of boxes, but got '{word_list[boxes_index]}'")
-
-    # Iterate through paragraphs in the document and replace placeholders
-    word_index = 0
-    for paragraph in doc.paragraphs:
-        for run in paragraph.runs:
-            if placeholder_format.format(placeholder=word_index + 1) in run.text and word_index < len(word_list):
-                if word_index == boxes_index:
-                    box_text = f"{num_boxes} diplomatic box" if num_boxes == 1 else f"{num_boxes} diplomatic boxes"
-                    run.text = run.text.replace(placeholder_format.format(placeholder=word_index + 1), box_text)
-                else:
-                    run.text = run.text.replace(placeholder_format.format(placeholder=word_index + 1), word_list[word_index])
-                run.font.color.rgb = RGBColor(0, 0, 0)
-                word_index += 1
-
-    if doc.tables == 0:
-        self.result_label.text = "Your document doesn't contain any tables."
-        return
-   
-
-    ##please work
-    table = doc.tables[0]
-    tag_start_index = 5 
-    # Assuming the table is the first table in the document
-    for i in range(num_boxes):
-        row = table.add_row()
-
-
-        # Set the row height to exactly 0.32 inches
-        tr = row._tr  # Access the row's XML element
-        trPr = tr.get_or_add_trPr()  # Get or create the row properties element
-        trHeight = OxmlElement('w:trHeight')  # Create a row height element
-        trHeight.set(qn('w:val'), str(int(Inches(0.000509090909091))))  # Convert 0.32 inches to twips (1 inch = 1440 twips)
-        trHeight.set(qn('w:hRule'), 'exact')  # Set the height rule to 'exact'
-        trPr.append(trHeight)  # Append the height element to the row properties
-
-        # Add the tag to the first column (left cell)
-        cell_1 = row.cells[1]
-        tag_value = word_list[tag_start_index + 2 * i]  # Every 2nd item is a tag
-        paragraph_1 = cell_1.paragraphs[0]
-        run_1 = paragraph_1.add_run(f"{tag_value}")
-        run_1.font.size = Pt(14)
-        run_1.font.color.rgb = RGBColor(0, 0, 0)  # Set text color to black
-        paragraph_1.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        cell_1.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-
-        # Add the description to the second column (right cell)
-        cell_2 = row.cells[0]
-        description_value = word_list[tag_start_index + 2 * i + 1]  # Every other item is a description
-        paragraph_2 = cell_2.paragraphs[0]
-        run_2 = paragraph_2.add_run(f"{description_value}")
-        run_2.font.size = Pt(14)
-        run_2.font.color.rgb = RGBColor(0, 0, 0)  # Set text color to black
-        paragraph_2.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        cell_2.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-
-    # Save the document
-    doc.save(output_path)
+        letter_history().record(word_list, fill_engine.template_cache.get(input_doc), output_doc, timings)
+    except (OSError, sqlite3.Error) as e:
+        Logger.error(f"Error recording the letter in the history: {e}")
+
+
+# Runs on the worker thread: load and compile a chosen template so the first
+# Submit finds it in the cache
+def load_template(input_doc):
+    import fill_engine
+
+    fill_engine.template_cache.get(input_doc)
 
 
 class ProfessionalApp(App):
@@ -158,6 +165,15 @@ class ProfessionalApp(App):
         self.input_doc = None
         scroll_view = ScrollView(size_hint=(1, None), size=(Window.width, Window.height))
         self.options = OPTIONS   # Store options in the a
+        self.usage = OPTION_USAGE
+        # Type-ahead search: one index per option list, built on the worker
+        # thread and given new options as they are added; keystrokes are
+        # coalesced so the search runs at most once per frame
+        self.search_indexes = {}
+        self.index_builds = set()
+        self.options.bind(self.on_options_added)
+        self.search_field = None
+        self.search_trigger = Clock.create_trigger(self.refresh_search)
         Window.bind(on_drop_file=self._on_file_drop)
 
         self.main_layout = BoxLayout(orientation='vertical', padding=30, spacing=20, size_hint_y=None)
@@ -176,25 +192,29 @@ class ProfessionalApp(App):
 
         # Name field
         self.name_input = self.create_centered_input("Enter or Select Name")
-        self.name_input.bind(focus=self.show_name_dropdown)
+        self.attach_option_dropdown(self.name_input, 'NAME_OPTIONS', searchable=True)
         self.main_layout.add_widget(Label(text="Name:", size_hint_y=None, height=30))
         self.main_layout.add_widget(self.name_input)
 
         # Consular ID field
         self.cons_id_input = self.create_centered_input("Enter or Select Consular ID")
-        self.cons_id_input.bind(focus=self.show_cons_id_dropdown)
+        self.attach_option_dropdown(self.cons_id_input, 'CONS_ID_OPTIONS', searchable=True)
         self.main_layout.add_widget(Label(text="Consular ID:", size_hint_y=None, height=30))
         self.main_layout.add_widget(self.cons_id_input)
 
         # Number of boxes
-        self.box_count_input = self.create_centered_input("Select Number of Boxes", readonly=True)
+        self.box_count_input = self.create_centered_input("Select or Enter Number of Boxes")
+        self.box_count_input.input_filter = 'int'
+        self.box_count_trigger = Clock.create_trigger(self.apply_box_count)
+        self.box_count_input.bind(text=lambda instance, text: self.box_count_trigger())
+        self.box_count_dropdown = None  # built on the first focus
         self.box_count_input.bind(focus=self.show_box_count_dropdown)
         self.main_layout.add_widget(Label(text="Number of Boxes:", size_hint_y=None, height=30))
         self.main_layout.add_widget(self.box_count_input)
 
         # Flight Number field (properly restored)
         self.flight_input = self.create_centered_input("Enter or Select Flight Number")
-        self.flight_input.bind(focus=self.show_flight_dropdown)
+        self.attach_option_dropdown(self.flight_input, 'FLIGHT_OPTIONS', searchable=True)
         self.main_layout.add_widget(Label(text="Flight Number:", size_hint_y=None, height=30))
         self.main_layout.add_widget(self.flight_input)
 
@@ -203,12 +223,19 @@ class ProfessionalApp(App):
         self.box_details_label.opacity = 0  # Initially hidden
         self.main_layout.add_widget(self.box_details_label)
 
-        # Dynamic inputs container for tag/description pairs
-        self.dynamic_inputs_container = BoxLayout(orientation='vertical', spacing=10, size_hint_y=None)
-        self.dynamic_inputs_container.bind(minimum_height=self.dynamic_inputs_container.setter('height'))
-        self.main_layout.add_widget(self.dynamic_inputs_container)
-
-        # Add a button to upload document with heartbeat effect
+        # Tag/description pairs: a plain BoxForm shown through a virtualized
+        # list, so only the rows on screen exist as widgets. The bulk fill bar
+        # and the list are built into this container the first time there are
+        # boxes to show.
+        self.box_form = BoxForm()
+        self.box_details = BoxLayout(orientation='vertical', spacing=20, size_hint_y=None, height=0)
+        self.box_details.bind(minimum_height=self.box_details.setter('height'))
+        self.main_layout.add_widget(self.box_details)
+        self.bulk_fill_bar = None
+        self.box_details_view = None
+        self.show_box_details(False)
+
+        # Add a button to upload document (pulses until a document is chosen)
         self.upload_doc_button = Button(
             text="drag and drop document (.docx)",
             size_hint=(1, None), height=50,
@@ -217,19 +244,34 @@ class ProfessionalApp(App):
         self.upload_doc_button.bind(on_release=self.show_file_chooser)  # Bind to show file chooser
         self.main_layout.add_widget(self.upload_doc_button)
 
-        # Start the heartbeat effect
+        # Pulse the upload button a few times; it stays red until a document is chosen
         self.document_selected = False
-        self.heartbeat_event = Clock.schedule_interval(self.heartbeat_effect, 0.5) 
+        self.pulse_upload_button()
 
         # Submit button
         self.submit_button = Button(text="Submit", size_hint=(None, None), size=(200, 50), pos_hint={'center_x': 0.5}, background_normal='', background_color=(0.3, 0.5, 0.7, 1), color=(1, 1, 1, 1))
         self.submit_button.bind(on_press=self.process_document)
+
+        # Document generation runs on a worker thread so the UI never blocks
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="document_filler")
+        # ...and so do the option files' journal appends and snapshots, and the
+        # usage scores saved after each letter
+        OPTIONS_STORE.writer = self.executor
+        OPTION_USAGE.writer = self.executor
+        self.job_in_flight = False
+        self.pending_job = None
+        self.loading_doc = None
         self.main_layout.add_widget(Widget(size_hint_y=None, height=20))
         self.main_layout.add_widget(self.submit_button)
 
         self.result_label = Label(text="", size_hint_y=None, height=50)
         self.main_layout.add_widget(self.result_label)
 
+        # Letters generated before, to regenerate or edit without retyping them
+        history_button = Button(text="Letter history", size_hint=(None, None), size=(270, 50), pos_hint={'center_x': 0.5})
+        history_button.bind(on_press=self.show_history_popup)
+        self.main_layout.add_widget(history_button)
+
         # Add Item Button (dimmed appearance)
         add_item_button = Button(
             text="Update dropdowns",
@@ -251,6 +293,9 @@ class ProfessionalApp(App):
         return scroll_view
     
     def show_add_item_popup(self, instance):
+        from kivy.uix.popup import Popup
+        from kivy.uix.spinner import Spinner
+
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
         dropdown_selector = Spinner(
@@ -272,145 +317,365 @@ class ProfessionalApp(App):
             size_hint_y=None,
             height=44
         )
+
+        # Bulk import from a .txt or .csv file, into the selected dropdown or
+        # the one the file name points to (names.txt, tags.txt, ...)
+        import_button = Button(
+            text='Import File...',
+            size_hint_y=None,
+            height=44
+        )
         
         content.add_widget(dropdown_selector)
         content.add_widget(new_item_input)
         content.add_widget(add_button)
+        content.add_widget(import_button)
         
         popup = Popup(
             title='Add New Item',
             content=content,
             size_hint=(None, None),
-            size=(400, 300)
+            size=(400, 360)
         )
         
         def check_dropdown_selection(*args):
             if dropdown_selector.text == 'Select Dropdown':  # Nothing selected
-                self.start_heartbeat_effect(dropdown_selector)  # Start heartbeat if no selection
+                pulse(dropdown_selector, (1, 0.2, 0.2, 1), (1, 1, 1, 1), beats=4, beat_duration=0.2)  # Flash if no selection
             else:
                 self.add_new_item(dropdown_selector.text, new_item_input.text, popup)
         
         add_button.bind(on_press=check_dropdown_selection)
+        import_button.bind(on_press=lambda x: self.show_import_chooser(dropdown_selector.text, popup))
         
         popup.open()
 
-    def start_heartbeat_effect(self, widget):
-        # Define a counter to keep track of the number of heartbeats
-        self.heartbeat_count = 0
-        
-        def beat(dt):
-            if self.heartbeat_count < 8:  # 6 toggles (3 red beats)
-                current_color = widget.background_color
-                if current_color == [1, 0.2, 0.2, 1]:  # If red
-                    widget.background_color = (1, 1, 1, 1)  # Toggle to white
-                else:
-                    widget.background_color = (1, 0.2, 0.2, 1)  # Toggle to red
-                self.heartbeat_count += 1
-            else:
-                widget.background_color = (1, 1, 1, 1)  # Reset to white after heartbeat
-                Clock.unschedule(heartbeat_event)  # Stop the heartbeat effect
-        
-        # Schedule the heartbeat effect to run every 0.2 seconds
-        heartbeat_event = Clock.schedule_interval(beat, 0.1)
+    def show_import_chooser(self, dropdown_name, add_item_popup):
+        from kivy.uix.filechooser import FileChooserIconView
+        from kivy.uix.popup import Popup
 
-    def add_new_item(self, dropdown_name, new_item, popup):
-        if not new_item.strip():
-            return  # Don't add empty items
+        add_item_popup.dismiss()
+        content = BoxLayout(orientation="vertical")
+        filechooser = FileChooserIconView(filters=["*.txt", "*.csv"], path=os.path.expanduser("~"))
+        button_layout = BoxLayout(orientation="horizontal", size_hint_y=None, height=50)
+        import_button = Button(text="Import", size_hint=(1, None), height=40)
+        cancel_button = Button(text="Cancel", size_hint=(1, None), height=40)
+        button_layout.add_widget(import_button)
+        button_layout.add_widget(cancel_button)
+        content.add_widget(filechooser)
+        content.add_widget(button_layout)
+        popup = Popup(title="Import options from a .txt or .csv file", content=content, size_hint=(0.9, 0.9))
 
-        option_key = f'{dropdown_name.upper().replace(" ", "_")}_OPTIONS'
-        if option_key in self.options:
-            if new_item not in self.options[option_key]:
-                self.options[option_key].append(new_item)
-                save_options(self.options)  # Save updated options to file
-                self.update_dropdowns()  # Ensure dropdowns are refreshed in the UI
+        def start_import(*args):
+            if filechooser.selection:
+                popup.dismiss()
+                self.import_option_file(filechooser.selection[0], dropdown_name)
 
-        popup.dismiss()
+        import_button.bind(on_release=start_import)
+        cancel_button.bind(on_release=popup.dismiss)
+        popup.open()
 
-    def update_dropdowns(self):
-        # Update name dropdown
-        self.name_input.bind(focus=self.show_name_dropdown)
+    def import_option_file(self, path, dropdown_name):
+        import import_options
 
-        # Update consular ID dropdown
-        self.cons_id_input.bind(focus=self.show_cons_id_dropdown)
+        option_key = DROPDOWN_OPTION_KEYS.get(dropdown_name) or import_options.list_for_file(path)
+        if option_key is None:
+            self.result_label.text = "Select the dropdown to import into."
+            return
+        self.result_label.text = f"Importing {os.path.basename(path)}..."
+        # The file is read and normalized on the worker thread; only merging
+        # the values into the options happens on the UI thread
+        future = self.executor.submit(lambda: list(import_options.read_options(path, option_key)))
+        future.add_done_callback(lambda future: Clock.schedule_once(lambda dt: self.on_import_read(path, option_key, future)))
 
-        # Update flight dropdown
-        self.flight_input.bind(focus=self.show_flight_dropdown)
+    def on_import_read(self, path, option_key, future):
+        import csv
 
-        # Update tag and description dropdowns in dynamic inputs
-        for box in self.dynamic_inputs_container.children:
-            tag_input, desc_input = box.children
-            tag_input.bind(focus=self.create_dropdown_function(tag_input, self.options['TAG_OPTIONS']))
-            desc_input.bind(focus=self.create_dropdown_function(desc_input, self.options['DESC_OPTIONS']))
+        try:
+            values = future.result()
+        except (OSError, ValueError, csv.Error) as e:
+            self.result_label.text = "Error reading the import file."
+            Logger.error(f"Error importing {path}: {e}")
+            return
+        # Merged a chunk per frame so the UI keeps drawing, then persisted by
+        # one snapshot, written on the worker thread
+        OPTIONS_STORE.begin_batch()
+        self.merge_imported(path, option_key, values)
 
-    def create_dropdown_function(self, text_input, options):
-        def show_dropdown(instance, value):
-            if value:
-                dropdown = DropDown()
-                for option in options:
-                    btn = Button(text=str(option), size_hint_y=None, height=44)
-                    btn.bind(on_release=lambda btn: self.select_from_dropdown(btn, text_input, dropdown))
-                    dropdown.add_widget(btn)
-                dropdown.open(text_input)
-        return show_dropdown
+    def merge_imported(self, path, option_key, values, start=0, added=0):
+        try:
+            added += len(self.options.add_many(option_key, values[start:start + IMPORT_CHUNK]))
+        except Exception:
+            OPTIONS_STORE.end_batch()
+            raise
+        start += IMPORT_CHUNK
+        if start < len(values):
+            Clock.schedule_once(lambda dt: self.merge_imported(path, option_key, values, start, added))
+            return
+        OPTIONS_STORE.end_batch()
+        self.result_label.text = f"Imported {added} new options from {os.path.basename(path)}."
+        Logger.info(f"Imported {added} of {len(values)} values from {path} into {option_key}")
 
-    def create_centered_input(self, hint_text, readonly=False):
-        return TextInput(hint_text=hint_text, size_hint=(None, None), size=(540, 50), multiline=False, readonly=readonly, pos_hint={'center_x': 0.5})
+    def record_usage(self, used):
+        # Only options in the lists are ranked, not values typed in once
+        used = {key: [option for option in options if self.options.has(key, option)] for key, options in used.items()}
+        try:
+            self.usage.record(used)
+        except OSError as e:
+            Logger.error(f"Error saving the option usage: {e}")
 
-    def show_box_count_dropdown(self, instance, value):
-        if value:
-            dropdown = DropDown()
-            for i in range(1, 7):
-                btn = Button(text=str(i), size_hint_y=None, height=44)
-                btn.bind(on_release=lambda btn: self.select_box_count(btn.text, dropdown))
-                dropdown.add_widget(btn)
-            dropdown.open(instance)
-
-    def select_box_count(self, text, dropdown):
-        self.box_count_input.text = text
-        dropdown.dismiss()
-        self.create_dynamic_dropdowns(int(text))
+    def show_history_popup(self, instance):
+        from kivy.uix.popup import Popup
 
-    def create_dynamic_dropdowns(self, num_boxes):
-        self.dynamic_inputs_container.clear_widgets()
-        self.box_details_label.opacity = 1
+        import history
 
-        for i in range(num_boxes):
-            box = BoxLayout(orientation='horizontal', spacing=10, size_hint_y=None, height=60)
-            tag_input = self.create_centered_input(f"Select Tag {i+1}")
-            tag_input.bind(focus=self.create_dropdown_function(tag_input, self.options['TAG_OPTIONS']))
-            desc_input = self.create_centered_input(f"Select Box Description {i+1}")
-            desc_input.bind(focus=self.create_dropdown_function(desc_input, self.options['DESC_OPTIONS']))
-            box.add_widget(tag_input)
-            box.add_widget(desc_input)
-            self.dynamic_inputs_container.add_widget(box)
+        content = BoxLayout(orientation='vertical', padding=10, spacing=10)
+        search_input = TextInput(hint_text='Name, consular ID or flight', multiline=False, size_hint_y=None, height=44)
+        letters_layout = BoxLayout(orientation='vertical', spacing=5, size_hint_y=None)
+        letters_layout.bind(minimum_height=letters_layout.setter('height'))
+        letters_view = ScrollView()
+        letters_view.add_widget(letters_layout)
+        close_button = Button(text='Close', size_hint_y=None, height=44)
+        content.add_widget(search_input)
+        content.add_widget(letters_view)
+        content.add_widget(close_button)
+        popup = Popup(title='Letter history', content=content, size_hint=(0.95, 0.9))
+
+        def choose(letter, action):
+            popup.dismiss()
+            action(letter)
+
+        def show_letters(dt=None):
+            # The latest matching letters; each lookup goes through an index
+            letters_layout.clear_widgets()
+            for letter in letter_history().find(search_input.text):
+                row = BoxLayout(orientation='horizontal', spacing=5, size_hint_y=None, height=44)
+                description = Label(text=history.describe(letter), halign='left', valign='middle', shorten=True)
+                description.bind(size=description.setter('text_size'))
+                regenerate_button = Button(text='Regenerate', size_hint_x=None, width=110)
+                regenerate_button.bind(on_release=lambda x, letter=letter: choose(letter, self.regenerate_letter))
+                edit_button = Button(text='Edit', size_hint_x=None, width=70)
+                edit_button.bind(on_release=lambda x, letter=letter: choose(letter, self.fill_form_from_letter))
+                for widget in (description, regenerate_button, edit_button):
+                    row.add_widget(widget)
+                letters_layout.add_widget(row)
+
+        search_trigger = Clock.create_trigger(show_letters)
+        search_input.bind(text=lambda instance, text: search_trigger())
+        close_button.bind(on_release=popup.dismiss)
+        show_letters()
+        popup.open()
 
-    def select_from_dropdown(self, button, text_input, dropdown):
-        text_input.text = button.text
-        dropdown.dismiss()
+    def regenerate_letter(self, letter):
+        self.result_label.text = "Regenerating document..."
+        future = self.executor.submit(letter_history().regenerate, letter['id'])
+        future.add_done_callback(lambda future: Clock.schedule_once(lambda dt: self.on_regenerated(letter, future)))
 
-    def show_name_dropdown(self, instance, value):
-        if value:
-            self.show_generic_dropdown(instance, self.options['NAME_OPTIONS'], self.name_input)
+    def on_regenerated(self, letter, future):
+        error = future.exception()
+        if error is None:
+            self.result_label.text = f"Document regenerated for {letter['name']}!"
+            Logger.info(f"Regenerated letter {letter['id']} to {future.result()}")
+        else:
+            self.result_label.text = "Error while regenerating the document."
+            Logger.error(f"Error regenerating letter {letter['id']}: {error!r}")
+
+    def fill_form_from_letter(self, letter):
+        # Put a past letter back in the form, to change it before submitting
+        self.name_input.text = letter['name']
+        self.cons_id_input.text = letter['cons_id']
+        self.flight_input.text = letter['flight']
+        count = min(len(letter['boxes']), MAX_BOXES)
+        self.box_form.resize(count)
+        for index, (tag, description) in enumerate(letter['boxes'][:count]):
+            self.box_form.set('tag', index, tag)
+            self.box_form.set('description', index, description)
+        self.box_count_input.text = str(count)
+        self.apply_box_count(0)
+        self.result_label.text = f"Letter of {letter['day']} loaded, submit to generate it again."
+
+    def pulse_upload_button(self):
+        pulse(self.upload_doc_button, (1, 0.5, 0.5, 1), (1, 0, 0, 1), beats=3)
 
-    def show_cons_id_dropdown(self, instance, value):
-        if value:
-            self.show_generic_dropdown(instance, self.options['CONS_ID_OPTIONS'], self.cons_id_input)
+    def add_new_item(self, dropdown_name, new_item, popup):
+        if not new_item.strip():
+            return  # Don't add empty items
 
-    def show_flight_dropdown(self, instance, value):
-        if value:
-            self.show_generic_dropdown(instance, self.options['FLIGHT_OPTIONS'], self.flight_input)
+        option_key = DROPDOWN_OPTION_KEYS.get(dropdown_name)
+        if option_key in self.options:
+            # Dropdowns notice the new version the next time they open
+            self.options.add(option_key, new_item)
 
-    def show_generic_dropdown(self, instance, options, target_input):
-        dropdown = DropDown()
-        for option in options:
-            btn = Button(text=option, size_hint_y=None, height=44)
-            btn.bind(on_release=lambda btn: self.select_from_dropdown(btn, target_input, dropdown))
-            dropdown.add_widget(btn)
-        dropdown.open(instance)
+        popup.dismiss()
 
+    def create_centered_input(self, hint_text, readonly=False):
+        return TextInput(hint_text=hint_text, size_hint=(None, None), size=(540, 50), multiline=False, readonly=readonly, pos_hint={'center_x': 0.5})
 
+    def show_box_count_dropdown(self, instance, value):
+        if not value:
+            return
+        if self.box_count_dropdown is None:
+            self.box_count_dropdown = OptionDropDown()
+            self.box_count_dropdown.set_options([str(i) for i in range(1, 7)])
+            self.box_count_dropdown.bind(on_select=lambda dropdown, text: self.select_box_count(text))
+        self.box_count_dropdown.open(instance)
+
+    def select_box_count(self, text):
+        self.box_count_input.text = text
+
+    def apply_box_count(self, dt):
+        # Boxes already filled in are kept when the count changes
+        text = self.box_count_input.text
+        count = int(text) if text.isdigit() else 0
+        if count > MAX_BOXES:
+            self.result_label.text = f"A letter can list at most {MAX_BOXES} boxes."
+            self.box_count_input.text = str(MAX_BOXES)
+            return
+        self.box_form.resize(count)
+        if count > 0:
+            self.build_box_details()
+        self.refresh_box_rows()
+        self.show_box_details(count > 0)
+
+    def build_box_details(self):
+        if self.box_details_view is not None:
+            return
+        self.bulk_fill_bar = self.create_bulk_fill_bar()
+        self.box_details.add_widget(self.bulk_fill_bar)
+        self.box_details_view = BoxDetailsView(self.box_form, size_hint_x=None, width=540, pos_hint={'center_x': 0.5})
+        self.box_details_view.bind(on_row_created=self.on_box_row_created)
+        self.box_details.add_widget(self.box_details_view)
+
+    def refresh_box_rows(self):
+        if self.box_details_view is not None:
+            self.box_details_view.refresh_rows()
+
+    def show_box_details(self, visible):
+        self.box_details_label.opacity = 1 if visible else 0
+        if self.bulk_fill_bar is not None:
+            self.bulk_fill_bar.opacity = 1 if visible else 0
+            self.bulk_fill_bar.disabled = not visible
+
+    def on_box_row_created(self, view, row):
+        self.attach_option_dropdown(row.tag_input, 'TAG_OPTIONS')
+        self.attach_option_dropdown(row.description_input, 'DESC_OPTIONS')
+
+    def create_bulk_fill_bar(self):
+        # Sets the tag or description of a range of boxes in one go
+        from kivy.uix.spinner import Spinner
+
+        bar = BoxLayout(orientation='horizontal', spacing=10, size_hint=(None, None), size=(540, 44), pos_hint={'center_x': 0.5})
+        self.bulk_field_spinner = Spinner(text='Tag', values=('Tag', 'Description'), size_hint_x=None, width=120)
+        self.bulk_value_input = TextInput(hint_text='Value', multiline=False)
+        self.bulk_from_input = TextInput(hint_text='From', multiline=False, input_filter='int', size_hint_x=None, width=70)
+        self.bulk_to_input = TextInput(hint_text='To', multiline=False, input_filter='int', size_hint_x=None, width=70)
+        fill_button = Button(text='Fill', size_hint_x=None, width=80)
+        fill_button.bind(on_release=self.bulk_fill)
+        for widget in (self.bulk_field_spinner, self.bulk_value_input, self.bulk_from_input, self.bulk_to_input, fill_button):
+            bar.add_widget(widget)
+        return bar
+
+    def bulk_fill(self, instance):
+        # Box numbers are 1-based and inclusive; an empty bound means the first or last box
+        try:
+            start = int(self.bulk_from_input.text or 1) - 1
+            stop = int(self.bulk_to_input.text or len(self.box_form))
+        except ValueError:
+            self.result_label.text = "Enter box numbers to fill."
+            return
+        field = 'tag' if self.bulk_field_spinner.text == 'Tag' else 'description'
+        filled = self.box_form.fill(field, self.bulk_value_input.text, start, stop)
+        self.refresh_box_rows()
+        Logger.info(f"Bulk filled the {field} of {filled} boxes")
+
+    def select_from_dropdown(self, text, text_input):
+        text_input.text = text
+
+    def attach_option_dropdown(self, text_input, option_key, searchable=False):
+        """ Give text_input its own dropdown over self.options[option_key].
+        Called once per input: the dropdown is built on the first focus, then
+        reused, and the handlers are bound exactly once. """
+        dropdown = None
+
+        def show_dropdown(instance, value):
+            nonlocal dropdown
+            if value:
+                if dropdown is None:
+                    dropdown = OptionDropDown()
+                    dropdown.bind(on_select=lambda dropdown, text: self.select_from_dropdown(text, text_input))
+                self.refresh_option_dropdown(text_input, dropdown, option_key, searchable)
+                dropdown.open(text_input)
+                if searchable:
+                    self.search_field = (text_input, dropdown, option_key)
+
+        text_input.bind(focus=show_dropdown)
+        if searchable:
+            text_input.bind(text=self.on_search_text)
+
+    def refresh_option_dropdown(self, text_input, dropdown, option_key, searchable):
+        # Only reload the rows when the options, their ranking or the query have changed
+        query = text_input.text.strip() if searchable else ""
+        version = (self.options.version(option_key), self.usage.ranking(option_key).version, query)
+        if dropdown.version != version:
+            dropdown.set_options(self.search_options(option_key, query))
+            dropdown.version = version
+
+    def option_index(self, option_key):
+        index = self.search_indexes.get(option_key)
+        if index is None:
+            # Searched by a scan until the full index is built
+            index = self.search_indexes[option_key] = OptionIndex()
+            index.add(self.options[option_key])
+            self.build_option_index(option_key)
+        return index
+
+    def on_options_added(self, option_key, added):
+        index = self.search_indexes.get(option_key)
+        if index is None:
+            return
+        index.add(added)
+        if len(index.added) > MERGE_AT:
+            self.build_option_index(option_key)
+
+    def build_option_index(self, option_key):
+        # A full build takes over a second for 100k options, so it runs on the
+        # worker over a copy of the list and is swapped in when done
+        if option_key in self.index_builds:
+            return
+        self.index_builds.add(option_key)
+        options = list(self.options[option_key])
+        future = self.executor.submit(OptionIndex, options)
+        future.add_done_callback(lambda future: Clock.schedule_once(
+            lambda dt: self.on_option_index_built(option_key, len(options), future)))
+
+    def on_option_index_built(self, option_key, count, future):
+        self.index_builds.discard(option_key)
+        index = future.result()
+        # Lists only grow, so what was added during the build is the tail
+        index.add(self.options[option_key][count:])
+        self.search_indexes[option_key] = index
+
+    def search_options(self, option_key, text):
+        # An empty field lists everything, a typed one the best matches; the
+        # options used most lately come first either way
+        ranking = self.usage.ranking(option_key)
+        if not text.strip():
+            return ranking.order(self.options[option_key])
+        return ranking.search(self.option_index(option_key), text, SEARCH_LIMIT)
+
+    def on_search_text(self, instance, value):
+        self.search_trigger()
+
+    def refresh_search(self, dt):
+        if self.search_field is None:
+            return
+        text_input, dropdown, option_key = self.search_field
+        if dropdown.attach_to is not None:
+            self.refresh_option_dropdown(text_input, dropdown, option_key, searchable=True)
 
     def show_file_chooser(self, instance):
+        from kivy.uix.filechooser import FileChooserIconView
+        from kivy.uix.popup import Popup
+
         # Create a vertical layout for the popup content
         content = BoxLayout(orientation="vertical")
         
@@ -450,100 +715,76 @@ class ProfessionalApp(App):
     def select_file(self, selection, popup):
         if selection:
             selected_file = selection[0]  # Get the first selected file
-            if selected_file.lower().endswith('.docx'):
-                # Update button text with the file name
-                self.upload_doc_button.text = os.path.basename(selected_file)
-                
-                # Set the selected file as the input document for further processing
-                self.input_doc = selected_file
-                
-                # Close the popup
-                popup.dismiss()
-                
-                # Optionally log the selection
-                Logger.info(f"Selected file: {selected_file}")
-            else:
-                Logger.warning("Invalid file type selected. Only .docx files are allowed.")
+            # Same checks and loading as a dropped file; the chooser stays
+            # open until the document is loaded
+            self.load_input_doc(selected_file, on_loaded=popup.dismiss)
+            Logger.info(f"Selected file: {selected_file}")
         else:
             Logger.warning("No file selected.")
 
-        # Heartbeat effect to pulse the button's color
-    def heartbeat_effect(self, dt):
-        if not self.document_selected:
-            current_color = self.upload_doc_button.background_color
-            # Toggle between two shades of red for the heartbeat effect
-            if current_color == [1, 0, 0, 1]:  # If red
-                self.upload_doc_button.background_color = (1, 0.5, 0.5, 1)  # Light red
-            else:
-                self.upload_doc_button.background_color = (1, 0, 0, 1)
-                
-
-
 
     def _on_file_drop(self, window, file_path, x, y):
-        file_path_decoded = file_path.decode("utf-8")  # Decode the file path (it's a byte string)
+        self.load_input_doc(file_path.decode("utf-8"))  # Decode the file path (it's a byte string)
 
+    def load_input_doc(self, file_path_decoded, on_loaded=None):
         # Check if the file is a .docx
         if not file_path_decoded.lower().endswith('.docx'):
             # Notify user the document must be .docx
             self.result_label.text = "Invalid file type. Please select a .docx file."
-            Logger.warning("Invalid file type dropped")
+            Logger.warning("Invalid file type")
             
             # Reset the document state to allow for the next attempt
             self.document_selected = False
             self.input_doc = None  # Clear any previous input_doc
-            return  # Discard the document and do nothing
+            return False  # Discard the document and do nothing
+
+        # Load and compile the document once, on the worker thread; Submit
+        # reuses the cached template. Only the latest file chosen is kept.
+        self.result_label.text = f"Loading {os.path.basename(file_path_decoded)}..."
+        future = self.loading_doc = self.executor.submit(load_template, file_path_decoded)
+        future.add_done_callback(lambda future: Clock.schedule_once(
+            lambda dt: self.on_input_doc_loaded(file_path_decoded, future, on_loaded)))
+        return True
 
-        # Load the document
-        try:
-            doc = Document(file_path_decoded)
-        except Exception as e:
+    def on_input_doc_loaded(self, file_path_decoded, future, on_loaded):
+        if future is not self.loading_doc:
+            return
+        self.loading_doc = None
+        error = future.exception()
+        if error is not None:
             self.result_label.text = "Error reading the document."
-            Logger.error(f"Error loading the .docx document: {e}")
+            Logger.error(f"Error loading the .docx document: {error}")
             
             # Reset the document state to allow for the next attempt
             self.document_selected = False
             self.input_doc = None  # Clear any previous input_doc
             return
 
-        # Iterate through paragraphs and remove trailing spaces and empty lines
-        for paragraph in doc.paragraphs:
-            # Remove trailing spaces in paragraph text
-            paragraph.text = paragraph.text.rstrip()
-
-        # Remove trailing empty paragraphs at the end
-        # Ensure that the element is actually a child of the document element before removing it
-        while doc.paragraphs and not doc.paragraphs[-1].text.strip():
-            try:
-                # Check if the element is a valid child before attempting removal
-                if doc.paragraphs[-1]._element in doc._element:
-                    doc._element.remove(doc.paragraphs[-1]._element)
-                else:
-                    Logger.warning("Attempted to remove a paragraph element that is not a valid child.")
-                    break  # If not a valid child, break the loop to prevent errors
-            except Exception as e:
-                Logger.error(f"Error removing paragraph element: {e}")
-                break
-
         # If everything is valid, update global input_doc with resource_path
         self.input_doc = resource_path(file_path_decoded)
+        self.result_label.text = ""
 
         # Extract and display only the file name, not the full path
         file_name = os.path.basename(file_path_decoded)
         self.upload_doc_button.text = file_name  # Update button text with file name
 
-        self.document_selected = True  # Stop the heartbeat effect
-        self.upload_doc_button.background_color = (0, 1, 0, 1)  # Change to green when valid file is dropped
-        Clock.unschedule(self.heartbeat_event)  # Stop the pulsing effect
+        self.document_selected = True
+        Animation.cancel_all(self.upload_doc_button, 'background_color')  # Stop any pulse still running
+        self.upload_doc_button.background_color = (0, 1, 0, 1)  # Change to green when a valid file is chosen
+        if on_loaded is not None:
+            on_loaded()
 
 
     def process_document(self, instance):
+        import fill_engine
+
         Logger.info("Submit button pressed")
         
         # Check if document is selected
         if not self.input_doc:
             self.result_label.text = "Please select a document before submitting."
             Logger.warning("No document selected")
+            self.pulse_upload_button()
             print(self.input_doc)
             return
 
@@ -556,46 +797,108 @@ class ProfessionalApp(App):
         # Get the input values
         name = self.name_input.text
         cons_id = self.cons_id_input.text
-        box_count = self.box_count_input.text
         flight = self.flight_input.text
 
-        # Prepare the word list for the document
-        word_list = [name, cons_id, box_count, flight]
-
-        # Collect tag and description dropdown values
-        for box in self.dynamic_inputs_container.children:
-            tag_input, desc_input = box.children
-            word_list.append(tag_input.text)
-            word_list.append(desc_input.text)
+        # Collect the tag and description of every box
+        boxes = self.box_form.boxes()
 
-        # Set today's date as the first placeholder
-        today_date = datetime.datetime.now().strftime("%B %d, %Y")
-        word_list.insert(0, today_date)
+        # Prepare the word list for the document, with today's date as the first placeholder
+        word_list = fill_engine.make_word_list(name, cons_id, flight, boxes)
 
         # Path to save the output document on the Desktop
         output_doc = os.path.join(os.path.expanduser("~"), "Desktop", "ENVOI PREMIER RL.docx")
 
-        # Call the document-filling function with the selected document
-        fill_placeholders(self.input_doc, output_doc, word_list, self)
+        # Options the letter uses, counted for the ranking once it is written
+        used = {
+            'NAME_OPTIONS': [name],
+            'CONS_ID_OPTIONS': [cons_id],
+            'FLIGHT_OPTIONS': [flight],
+            'TAG_OPTIONS': [tag for tag, _ in boxes],
+            'DESC_OPTIONS': [description for _, description in boxes],
+        }
 
-        # Display confirmation
-        self.result_label.text = "Document filled and saved to Desktop!"
+        # Generate the document on the worker thread
+        self.submit_job((self.input_doc, output_doc, word_list, name, used))
 
-        # Clear all input fields
-        self.clear_all_fields()
+    def submit_job(self, job):
+        # While a document is being written, only the latest waiting job is kept
+        if self.job_in_flight:
+            self.pending_job = job
+            return
 
-        try:
+        input_doc, output_doc, word_list, name, used = job
+        self.job_in_flight = True
+        self.submit_button.disabled = True
+        self.result_label.text = "Generating document..."
+        future = self.executor.submit(generate_document, input_doc, output_doc, word_list)
+        # Results are handled back on the Kivy main thread
+        future.add_done_callback(lambda future: Clock.schedule_once(lambda dt: self.on_job_done(job, future)))
+
+    def on_job_done(self, job, future):
+        import fill_engine
+
+        self.job_in_flight = False
+        name = job[3]
+        error = future.exception()
+        if error is None:
+            # Display confirmation
+            self.result_label.text = "Document filled and saved to Desktop!"
             Logger.info(f"Document processing completed for: {name}")
-            
+            Logger.info(f"Template cache: {fill_engine.template_cache.stats()}")
+            self.record_usage(job[4])
+
+            # Clear all input fields
+            self.clear_all_fields()
+
             # Automatically open the document based on the OS
-           # self.open_document(output_doc)
-            
-        except Exception as e:
-            Logger.error(f"Error during document processing: {e}")
-            raise
+           # self.open_document(job[1])
+        elif isinstance(error, fill_engine.TemplateError):
+            self.result_label.text = str(error)
+            Logger.error(f"Error filling the document: {error}")
+        else:
+            self.result_label.text = "Error while generating the document."
+            Logger.error(f"Error during document processing: {error!r}")
+
+        if self.pending_job is not None:
+            job, self.pending_job = self.pending_job, None
+            self.submit_job(job)
+        else:
+            self.submit_button.disabled = False
+
+    def on_start(self):
+        startup.mark("build")
+        # Slow the event loop down while nobody is using the app. Kept on the
+        # app: the clock only holds weak references to their callbacks
+        self.idle_throttle = IdleThrottle(Window)
+        self.idle_throttle.install()
+        if IDLE_STATS:
+            self.idle_stats = IdleStats(Window)
+            self.idle_stats.start()
+        startup.on_first_frame(Window, self.on_first_frame)
+
+    def on_first_frame(self):
+        startup.mark("first frame")
+        if STARTUP_REPORT:
+            startup.write_report(STARTUP_REPORT)
+            self.stop()
+            return
+        # Load the fill engine while the user fills in the form, so the first
+        # document does not wait for python-docx
+        self.executor.submit(importlib.import_module, "fill_engine")
+
+    def on_stop(self):
+        # Let a document that is being written finish before exiting
+        self.executor.shutdown(wait=True)
+        # Fold the journal of added items into the options file
+        OPTIONS_STORE.close()
+        if _letter_history is not None:
+            _letter_history.close()
 
     # Function to open the document based on the OS
     def open_document(self, file_path):
+        import platform
+        import subprocess
+
         # Detect the platform and open the document accordingly
         try:
             if platform.system() == "Darwin":  # macOS
@@ -610,6 +913,8 @@ class ProfessionalApp(App):
 
 
     def show_password_popup(self, instance):
+        from kivy.uix.popup import Popup
+
             # Create a popup content layout
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
 
@@ -648,6 +953,8 @@ class ProfessionalApp(App):
         password_popup.open()
 
     def check_password(self, entered_password, popup):
+        from kivy.uix.popup import Popup
+
         # Check if the entered password is correct
         if entered_password == '1975':
             popup.dismiss()  # Close the popup
@@ -665,18 +972,16 @@ class ProfessionalApp(App):
     def all_fields_filled(self):
         if not all([self.name_input.text, self.cons_id_input.text, self.box_count_input.text, self.flight_input.text]):
             return False
-        for box in self.dynamic_inputs_container.children:
-            tag_input, desc_input = box.children
-            if not tag_input.text or not desc_input.text:
-                return False
-        return True
+        return self.box_form.complete()
 
     def clear_all_fields(self):
         self.name_input.text = ""
         self.cons_id_input.text = ""
         self.box_count_input.text = ""
         self.flight_input.text = ""
-        self.dynamic_inputs_container.clear_widgets()
+        self.box_form.resize(0)
+        self.refresh_box_rows()
+        self.show_box_details(False)
 
 
 # Run the app
@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('cons_ids.txt', '.'), ('descriptions.txt', '.'), ('dropdown_options.json', '.'), ('filldoc.docm', '.'), ('filldoc.docx', '.'), ('flights.txt', '.'), ('names.txt', '.'), ('tags.txt', '.'), ('user_selections.txt', '.'), ('app.log', '.')],
-    hiddenimports=['kivy', 'kivy.deps.sdl2', 'kivy.deps.glew'],
+    hiddenimports=['kivy', 'kivy.deps.sdl2', 'kivy.deps.glew', 'batch', 'render_server', 'import_options', 'startup', 'history'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
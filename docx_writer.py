@@ -0,0 +1,90 @@
+# Writes a filled package by copying the template zip member by member.
+#
+# Only the parts that were modified are compressed again; every other member
+# (images, styles, themes, headers, ...) is copied as its already-compressed
+# bytes straight from the template, so saving costs roughly one deflate of
+# word/document.xml plus a memcpy of the rest.
+import io
+import struct
+import zipfile
+import zlib
+
+# Deflate level used for the modified parts; 0 stores them uncompressed
+DEFAULT_COMPRESS_LEVEL = 6
+
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+_END_RECORD = struct.Struct("<4s4H2LH")
+_UTF8_FLAG = 0x800
+
+
+def _dos_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+def _compress(data, compresslevel):
+    if compresslevel == 0:
+        return zipfile.ZIP_STORED, data
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+    return zipfile.ZIP_DEFLATED, compressor.compress(data) + compressor.flush()
+
+
+def _raw_member(source, info):
+    """ The compressed bytes of a member, exactly as stored in the source zip """
+    source.seek(info.header_offset)
+    header = _LOCAL_HEADER.unpack(source.read(_LOCAL_HEADER.size))
+    name_length, extra_length = header[9], header[10]
+    source.seek(name_length + extra_length, io.SEEK_CUR)
+    return source.read(info.compress_size)
+
+
+def write_package(template_data, output, replacements, compresslevel=DEFAULT_COMPRESS_LEVEL):
+    """ Write template_data (the template .docx bytes) to output, a path or a
+    binary file object, with the members named in replacements swapped for new
+    uncompressed content. Returns the number of bytes written. """
+    if isinstance(output, (str, bytes)) or hasattr(output, "__fspath__"):
+        with open(output, "wb") as f:
+            return write_package(template_data, f, replacements, compresslevel)
+
+    source = io.BytesIO(template_data)
+    central = []
+    offset = 0
+    with zipfile.ZipFile(source) as package:
+        for info in package.infolist():
+            if info.filename in replacements:
+                data = replacements[info.filename]
+                crc = zlib.crc32(data)
+                size = len(data)
+                method, payload = _compress(data, compresslevel)
+            else:
+                crc = info.CRC
+                size = info.file_size
+                method = info.compress_type
+                payload = _raw_member(source, info)
+
+            name = info.filename.encode("utf-8")
+            # No data descriptor: sizes and CRC are known up front
+            flags = (info.flag_bits & ~0x08) | (_UTF8_FLAG if not info.filename.isascii() else 0)
+            dos_time, dos_date = _dos_time(info.date_time)
+            output.write(_LOCAL_HEADER.pack(
+                b"PK\x03\x04", 20, flags, method, dos_time, dos_date,
+                crc, len(payload), size, len(name), 0,
+            ))
+            output.write(name)
+            output.write(payload)
+            central.append((name, flags, method, dos_time, dos_date, crc, len(payload), size, info.external_attr, offset))
+            offset += _LOCAL_HEADER.size + len(name) + len(payload)
+
+    directory_offset = offset
+    for name, flags, method, dos_time, dos_date, crc, compress_size, size, external_attr, header_offset in central:
+        output.write(_CENTRAL_HEADER.pack(
+            b"PK\x01\x02", 20, 20, flags, method, dos_time, dos_date,
+            crc, compress_size, size, len(name), 0, 0, 0, 0, external_attr, header_offset,
+        ))
+        output.write(name)
+        offset += _CENTRAL_HEADER.size + len(name)
+    output.write(_END_RECORD.pack(
+        b"PK\x05\x06", 0, 0, len(central), len(central), offset - directory_offset, directory_offset, 0,
+    ))
+    return offset + _END_RECORD.size
@@ -0,0 +1,77 @@
+# asyncio front end for the headless fill engine.
+#
+# Filling is CPU work, so it always runs on an executor: the event loop's
+# default thread pool, or any executor passed in (a ProcessPoolExecutor spreads
+# documents over cores; each worker process keeps its own template cache).
+#
+#   filler = AsyncFiller(limit=8)
+#   data = await filler.fill("filldoc.docx", word_list)
+#   async for key, data in filler.iter_filled("filldoc.docx", records):
+#       ...
+import asyncio
+import os
+
+import docx_writer
+import fill_engine
+
+
+def _render(template, word_list, compresslevel):
+    # Top-level so it can be sent to worker processes
+    if not isinstance(template, fill_engine.CompiledTemplate):
+        template = fill_engine.template_cache.get(template)
+    return template.render_bytes(word_list, compresslevel)
+
+
+async def fill_async(template, word_list, *, executor=None, compresslevel=docx_writer.DEFAULT_COMPRESS_LEVEL):
+    """ Fill template (a path, or a CompiledTemplate for thread executors) and
+    return the .docx bytes. Cancelling the call drops the result; a document
+    already being rendered on the executor is allowed to finish. """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _render, template, word_list, compresslevel)
+
+
+async def _aiter(records):
+    if hasattr(records, "__aiter__"):
+        async for record in records:
+            yield record
+    else:
+        for record in records:
+            yield record
+
+
+class AsyncFiller:
+    """ Bounded-concurrency filler shared by every coroutine of a service: at
+    most `limit` documents are in flight on the executor at any time. """
+
+    def __init__(self, executor=None, limit=None, compresslevel=docx_writer.DEFAULT_COMPRESS_LEVEL):
+        self.executor = executor
+        self.limit = limit or os.cpu_count() or 1
+        self.compresslevel = compresslevel
+        self._semaphore = asyncio.Semaphore(self.limit)
+
+    async def fill(self, template, word_list):
+        async with self._semaphore:
+            return await fill_async(template, word_list, executor=self.executor, compresslevel=self.compresslevel)
+
+    async def _fill_keyed(self, template, key, word_list):
+        return key, await self.fill(template, word_list)
+
+    async def iter_filled(self, template, records):
+        """ Yield (key, bytes) for (key, word_list) records, a sync or async
+        iterable, in completion order. At most `limit` records are read ahead;
+        closing or cancelling the iteration cancels the ones still pending. """
+        pending = set()
+        try:
+            async for key, word_list in _aiter(records):
+                pending.add(asyncio.ensure_future(self._fill_keyed(template, key, word_list)))
+                if len(pending) >= self.limit:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
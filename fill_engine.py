@@ -0,0 +1,454 @@
+# Headless document-filling core.
+#
+# This module must stay importable without Kivy: it only imports python-docx
+# and lxml, opens no window, configures no logging and reads no files at import
+# time, so it can be used from scripts, batch jobs and server processes.
+import copy
+import datetime
+import hashlib
+import io
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+
+from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.table import Table
+from docx.text.run import Run
+from docx.shared import Pt, RGBColor, Inches
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.enum.table import WD_ALIGN_VERTICAL
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.opc.oxml import serialize_part_xml
+
+import docx_writer
+import instrumentation
+
+# Cold-start budget for `import fill_engine` in a fresh interpreter
+IMPORT_BUDGET_MS = 300
+
+# Layout of the word list: date, name, consular ID, number of boxes, flight,
+# then one (tag, description) pair per box
+BOXES_INDEX = 3
+TAG_START_INDEX = 5
+
+# Named placeholder keys, in word list order; "{1}" .. "{5}" are accepted as well,
+# and "{box_count}" is the bare number of boxes
+FIELD_KEYS = ("date", "name", "cons_id", "boxes", "flight")
+PLACEHOLDER_KEYS = frozenset(FIELD_KEYS + ("box_count",) + tuple(str(i + 1) for i in range(len(FIELD_KEYS))))
+PLACEHOLDER_PATTERN = re.compile(r"\{(\w+)\}")
+
+# Exact height of every added box row (0.32 inches in the original template)
+ROW_HEIGHT = str(int(Inches(0.000509090909091)))
+
+
+class TemplateError(ValueError):
+    """ Raised when the template or the values cannot be used to fill a document """
+
+
+def make_word_list(name, cons_id, flight, boxes, date=None):
+    """ Build the word list expected by fill_placeholders from shipment fields """
+    if date is None:
+        date = datetime.datetime.now().strftime("%B %d, %Y")
+    word_list = [date, name, cons_id, str(len(boxes)), flight]
+    for tag, description in boxes:
+        word_list.append(tag)
+        word_list.append(description)
+    return word_list
+
+
+def record_word_list(record):
+    """ Word list for a shipment record: a dict with name, cons_id, flight,
+    boxes (a list of {"tag", "description"} dicts) and an optional date """
+    boxes = [(box["tag"], box["description"]) for box in record["boxes"]]
+    return make_word_list(record["name"], record["cons_id"], record["flight"], boxes, date=record.get("date"))
+
+
+def box_count_text(num_boxes):
+    return f"{num_boxes} diplomatic box" if num_boxes == 1 else f"{num_boxes} diplomatic boxes"
+
+
+def _node_path(root, node):
+    """ Child indices leading from root down to node """
+    path = []
+    while node is not root:
+        parent = node.getparent()
+        path.append(parent.index(node))
+        node = parent
+    return tuple(reversed(path))
+
+
+def _node_at(root, path):
+    node = root
+    for index in path:
+        node = node[index]
+    return node
+
+
+def template_values(word_list, num_boxes):
+    """ Placeholder values by key: numbered keys follow the word list, named keys
+    are their readable aliases """
+    values = {}
+    for index, key in enumerate(FIELD_KEYS):
+        value = box_count_text(num_boxes) if index == BOXES_INDEX else word_list[index]
+        values[key] = value
+        values[str(index + 1)] = value
+    values["box_count"] = str(num_boxes)
+    return values
+
+
+def _split_placeholders(t_nodes):
+    """ Find {key} placeholders in the text of one paragraph, even when the text
+    is split over several runs. Returns one parts list per w:t node, made of
+    literal strings and (key,) tuples, or None when there is nothing to fill. """
+    text = "".join(t.text or "" for t in t_nodes)
+    matches = [m for m in PLACEHOLDER_PATTERN.finditer(text) if m.group(1) in PLACEHOLDER_KEYS]
+    if not matches:
+        return None
+
+    # Character range [start, end) owned by each w:t node
+    bounds = []
+    position = 0
+    for t in t_nodes:
+        bounds.append((position, position + len(t.text or "")))
+        position += len(t.text or "")
+
+    parts = [[] for _ in t_nodes]
+    node = 0
+
+    def add_literal(start, end):
+        nonlocal node
+        while start < end:
+            while bounds[node][1] <= start:
+                node += 1
+            stop = min(end, bounds[node][1])
+            parts[node].append(text[start:stop])
+            start = stop
+
+    cursor = 0
+    for match in matches:
+        add_literal(cursor, match.start())
+        while bounds[node][1] <= match.start():
+            node += 1
+        parts[node].append((match.group(1),))
+        cursor = match.end()
+    add_literal(cursor, len(text))
+    return parts
+
+
+class CompiledTemplate:
+    """ A template parsed once, with the location of every placeholder and of the
+    box table recorded so each fill is a handful of direct assignments """
+
+    def __init__(self, doc_path, data=None):
+        with instrumentation.span("load", template=doc_path) as record:
+            if data is None:
+                with open(doc_path, 'rb') as f:
+                    data = f.read()
+            record["bytes_read"] = len(data)
+            self._compile(doc_path, data)
+
+    def _compile(self, doc_path, data):
+        self.path = doc_path
+        self.data = data
+        self.sha256 = hashlib.sha256(data).hexdigest()
+        self.document = Document(io.BytesIO(data))
+        # Rough in-memory footprint: the unpacked size of every package part
+        with zipfile.ZipFile(io.BytesIO(data)) as package:
+            self.nbytes = len(data) + sum(info.file_size for info in package.infolist())
+        root = self.document.element
+
+        # Render plan per story part (body, headers, footers): the member name,
+        # the template element and (path to a w:t node, parts) slots
+        self.stories = []
+        story_parts = [self.document.part] + [
+            rel.target_part for rel in self.document.part.rels.values()
+            if not rel.is_external and rel.reltype in (RT.HEADER, RT.FOOTER)
+        ]
+        for part in story_parts:
+            slots = self._compile_story(part.element)
+            if slots or part is self.document.part:
+                self.stories.append((part.partname.membername, part.element, slots))
+
+        # Templates without any {key} placeholder use the numbered runs 1, 2, 3, ...
+        if not any(slots for _, _, slots in self.stories):
+            self.stories[0] = self.stories[0][:2] + (self._compile_numbered_runs(root),)
+
+        # The box details go into the first table of the document
+        self.table_path = None
+        if self.document.tables:
+            table = self.document.tables[0]
+            self.table_path = _node_path(root, table._tbl)
+            self.row_prototype, self.row_text_paths = self._compile_row_prototype(table)
+
+    @staticmethod
+    def _compile_row_prototype(table):
+        """ Build one fully styled box row on a scratch copy of the table. Filling
+        a row is then a deep copy of it plus two text assignments. """
+        scratch = Table(copy.deepcopy(table._tbl), table._parent)
+        row = scratch.add_row()
+
+        # Set the row height to exactly 0.32 inches
+        trPr = row._tr.get_or_add_trPr()
+        trHeight = OxmlElement('w:trHeight')
+        trHeight.set(qn('w:val'), ROW_HEIGHT)
+        trHeight.set(qn('w:hRule'), 'exact')
+        trPr.append(trHeight)
+
+        # Tag in the left column, description in the right column
+        text_paths = []
+        for cell in row.cells[:2]:
+            paragraph = cell.paragraphs[0]
+            run = paragraph.add_run("-")
+            run.font.size = Pt(14)
+            run.font.color.rgb = RGBColor(0, 0, 0)  # Set text color to black
+            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+            t = run._r.find(qn('w:t'))
+            t.text = ""
+            t.set(qn('xml:space'), 'preserve')
+            text_paths.append(_node_path(row._tr, t))
+
+        scratch._tbl.remove(row._tr)
+        return row._tr, text_paths
+
+    def _compile_story(self, story_root):
+        # Group the w:t nodes by their own paragraph in one pass over the part
+        paragraphs = {}
+        for t in story_root.iter(qn('w:t')):
+            paragraph = next(t.iterancestors(qn('w:p')), None)
+            paragraphs.setdefault(paragraph, []).append(t)
+
+        slots = []
+        for t_nodes in paragraphs.values():
+            parts = _split_placeholders(t_nodes)
+            if parts is None:
+                continue
+            for t, t_parts in zip(t_nodes, parts):
+                if any(isinstance(part, tuple) for part in t_parts):
+                    slots.append(self._slot(story_root, t, t_parts))
+                else:
+                    # Only held characters of a placeholder split over several
+                    # runs; what is left (e.g. "} of Paris") may now start or
+                    # end with a space Word would otherwise drop
+                    t.text = "".join(t_parts)
+                    t.set(qn('xml:space'), 'preserve')
+        return slots
+
+    def _compile_numbered_runs(self, root):
+        slots = []
+        placeholder_format = "{placeholder}"
+        word_index = 0
+        for paragraph in self.document.paragraphs:
+            for run in paragraph.runs:
+                if word_index >= TAG_START_INDEX:
+                    break
+                placeholder = placeholder_format.format(placeholder=word_index + 1)
+                for t in run._r.findall(qn('w:t')):
+                    if t.text and placeholder in t.text:
+                        before, _, after = t.text.partition(placeholder)
+                        slots.append(self._slot(root, t, [before, (placeholder,), after]))
+                        word_index += 1
+                        break
+        return slots
+
+    @staticmethod
+    def _slot(root, t, parts):
+        t.set(qn('xml:space'), 'preserve')
+        # Filled values are always black, so the colour is applied once here
+        if t.getparent().tag == qn('w:r'):
+            Run(t.getparent(), None).font.color.rgb = RGBColor(0, 0, 0)
+        return _node_path(root, t), [part for part in parts if part != ""]
+
+    def render(self, word_list, output_path, compresslevel=docx_writer.DEFAULT_COMPRESS_LEVEL):
+        """ Fill the template into output_path, a file path or any writable binary
+        file object (the package is written sequentially, no seeking needed) """
+        num_boxes = self.check_word_list(word_list)
+        fill = instrumentation.new_fill_id()
+        with instrumentation.span("substitute", fill=fill, template=self.path):
+            stories = self.substitute(word_list, num_boxes)
+        with instrumentation.span("table", fill=fill, template=self.path, rows=num_boxes):
+            self.grow_table(stories, word_list, num_boxes)
+        with instrumentation.span("save", fill=fill, template=self.path) as record:
+            record["bytes_written"] = self.save(stories, output_path, compresslevel)
+
+    # The render stages, also used on their own by the benchmarks
+
+    def check_word_list(self, word_list):
+        """ Validate the word list and return the number of boxes """
+        # Try to extract the number of boxes
+        try:
+            num_boxes = int(word_list[BOXES_INDEX])
+        except ValueError:
+            raise TemplateError(f"Expected an integer for number of boxes, but got '{word_list[BOXES_INDEX]}'")
+
+        if len(word_list) < TAG_START_INDEX + 2 * num_boxes:
+            raise TemplateError(f"Expected a tag and a description for each of the {num_boxes} boxes")
+
+        if self.table_path is None:
+            raise TemplateError("Your document doesn't contain any tables.")
+        return num_boxes
+
+    def substitute(self, word_list, num_boxes):
+        """ Filled copies of the story parts, by member name """
+        values = template_values(word_list, num_boxes)
+        stories = {}
+        for membername, story_root, slots in self.stories:
+            story = copy.deepcopy(story_root)
+            for path, parts in slots:
+                _node_at(story, path).text = "".join(values[part[0]] if isinstance(part, tuple) else part for part in parts)
+            stories[membername] = story
+        return stories
+
+    def grow_table(self, stories, word_list, num_boxes):
+        tbl = _node_at(stories[self.document.part.partname.membername], self.table_path)
+        tag_path, description_path = self.row_text_paths
+        for i in range(num_boxes):
+            tr = copy.deepcopy(self.row_prototype)
+            _node_at(tr, tag_path).text = word_list[TAG_START_INDEX + 2 * i]
+            _node_at(tr, description_path).text = word_list[TAG_START_INDEX + 2 * i + 1]
+            tbl.append(tr)
+
+    def save(self, stories, output_path, compresslevel=docx_writer.DEFAULT_COMPRESS_LEVEL):
+        # Only the filled story parts changed; every other part is copied as is
+        return docx_writer.write_package(
+            self.data, output_path,
+            {membername: serialize_part_xml(story) for membername, story in stories.items()},
+            compresslevel,
+        )
+
+    def render_bytes(self, word_list, compresslevel=docx_writer.DEFAULT_COMPRESS_LEVEL):
+        buffer = io.BytesIO()
+        self.render(word_list, buffer, compresslevel)
+        return buffer.getvalue()
+
+
+def compile_template(doc_path):
+    return CompiledTemplate(doc_path)
+
+
+class TemplateCache:
+    """ Bounded LRU cache of compiled templates keyed by path.
+
+    An entry is reused while the file's mtime and size are unchanged; when they
+    change the content hash decides whether the template must be recompiled.
+    """
+
+    def __init__(self, max_entries=8, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # path -> ((mtime_ns, size), CompiledTemplate)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, doc_path):
+        key = os.path.abspath(doc_path)
+        st = os.stat(key)
+        file_stat = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == file_stat:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            with open(key, 'rb') as f:
+                data = f.read()
+            if entry is not None and entry[1].sha256 == hashlib.sha256(data).hexdigest():
+                # Touched but not modified
+                self._entries[key] = (file_stat, entry[1])
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            compiled = CompiledTemplate(doc_path, data)
+            if entry is not None:
+                self._bytes -= entry[1].nbytes
+            self._entries[key] = (file_stat, compiled)
+            self._entries.move_to_end(key)
+            self._bytes += compiled.nbytes
+            # Evict least recently used templates, always keeping the newest one
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+            return compiled
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+# Process-wide cache used by fill_placeholders
+template_cache = TemplateCache()
+
+
+# Function that fills the placeholders in the document
+def fill_placeholders(doc_path, output_path, word_list, compresslevel=docx_writer.DEFAULT_COMPRESS_LEVEL):
+    template_cache.get(doc_path).render(word_list, output_path, compresslevel)
+
+
+def iter_filled(template, records, output=None, compresslevel=docx_writer.DEFAULT_COMPRESS_LEVEL):
+    """ Fill the template once per (key, word_list) record, lazily.
+
+    template is a path (served from template_cache) or a CompiledTemplate.
+    Without output, yields (key, docx bytes). With output, a callable returning
+    a writable binary file object for a key, each document is written into that
+    object and (key, object) is yielded. Only one document is held at a time.
+    """
+    if not isinstance(template, CompiledTemplate):
+        template = template_cache.get(template)
+    for key, word_list in records:
+        if output is None:
+            yield key, template.render_bytes(word_list, compresslevel)
+        else:
+            target = output(key)
+            template.render(word_list, target, compresslevel)
+            yield key, target
+
+
+def measure_import_time():
+    """ Import this module in a fresh interpreter and return the cumulative import time in ms """
+    import subprocess
+    import sys
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import fill_engine"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True,
+    )
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == "fill_engine":
+            return int(fields[1]) / 1000.0
+    raise RuntimeError("Could not find fill_engine in the import time report")
+
+
+def check_import_budget(budget_ms=IMPORT_BUDGET_MS):
+    elapsed_ms = measure_import_time()
+    if elapsed_ms > budget_ms:
+        raise RuntimeError(f"Importing fill_engine took {elapsed_ms:.1f} ms, budget is {budget_ms} ms")
+    return elapsed_ms
+
+
+if __name__ == "__main__":
+    print(f"fill_engine import time: {check_import_budget():.1f} ms (budget {IMPORT_BUDGET_MS} ms)")
@@ -0,0 +1,279 @@
+# History of the generated letters, and regeneration from it.
+#
+#   document_filler history list [QUERY] [--day YYYY-MM-DD] [--limit N]
+#   document_filler history show ID
+#   document_filler history regenerate ID [--out PATH] [--today]
+#
+# Every letter the app writes is recorded in a SQLite database in the home
+# directory: its date, name, consular ID, flight and boxes, the template's
+# path and sha256, the output path and the time taken by each fill stage.
+# Lookups go through indexes on the day and on case-folded copies of the
+# name, consular ID and flight; a QUERY matches the start of any of the last
+# three, ignoring case (any script's, not only ASCII's as NOCASE would). A query
+# common enough to fill the page is answered by scanning the RECENT_SCAN
+# newest letters; a rarer one by the three indexes, whose matches are then
+# few enough to sort by date cheaply.
+#
+# Each template is stored once, by hash, so a letter can be regenerated with
+# exactly the template it was made from even after the file has been edited
+# or moved. Regeneration keeps the letter's date unless --today is given, and
+# is not recorded again.
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import fill_engine
+import instrumentation
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), "document_filler_history.sqlite3")
+FIND_LIMIT = 50
+RECENT_SCAN = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    sha256 TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS letters (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    day TEXT NOT NULL,
+    date TEXT NOT NULL,
+    name TEXT NOT NULL,
+    cons_id TEXT NOT NULL,
+    flight TEXT NOT NULL,
+    boxes TEXT NOT NULL,
+    template_path TEXT NOT NULL,
+    template_sha256 TEXT NOT NULL REFERENCES templates (sha256),
+    output_path TEXT NOT NULL,
+    timings TEXT NOT NULL,
+    name_key TEXT NOT NULL DEFAULT '',
+    cons_id_key TEXT NOT NULL DEFAULT '',
+    flight_key TEXT NOT NULL DEFAULT ''
+);
+"""
+# Created after KEY_COLUMNS are added to a database made before they existed
+INDEXES = """
+DROP INDEX IF EXISTS letters_name;
+DROP INDEX IF EXISTS letters_cons_id;
+DROP INDEX IF EXISTS letters_flight;
+CREATE INDEX IF NOT EXISTS letters_day ON letters (day);
+CREATE INDEX IF NOT EXISTS letters_name_key ON letters (name_key);
+CREATE INDEX IF NOT EXISTS letters_cons_id_key ON letters (cons_id_key);
+CREATE INDEX IF NOT EXISTS letters_flight_key ON letters (flight_key);
+"""
+
+FIELDS = ("created", "day", "date", "name", "cons_id", "flight", "boxes", "template_path", "template_sha256",
+          "output_path", "timings")
+COLUMNS = ", ".join(("id",) + FIELDS)
+# str.casefold() of name, cons_id and flight, which find() compares against
+KEY_COLUMNS = {"name_key": "name", "cons_id_key": "cons_id", "flight_key": "flight"}
+
+
+@contextmanager
+def timed_stages():
+    """ Collect the duration of the fill stages run on this thread inside the
+    block: {"substitute": s, "table": s, "save": s, "total": s} """
+    timings = {}
+    thread = threading.get_ident()
+
+    def hook(span):
+        if threading.get_ident() == thread:
+            timings[span["stage"]] = span["duration"]
+
+    instrumentation.add_hook(hook)
+    start = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings["total"] = time.perf_counter() - start
+        instrumentation.remove_hook(hook)
+
+
+# Letters whose case-folded name, consular ID or flight starts with :low; the unary +
+# keeps SQLite from answering through the indexes (see LetterHistory.find)
+RECENT_MATCHES = """
+SELECT {columns} FROM letters
+WHERE id > (SELECT ifnull(max(id), 0) FROM letters) - :scan
+  AND (+name_key >= :low AND +name_key < :high OR +cons_id_key >= :low AND +cons_id_key < :high
+       OR +flight_key >= :low AND +flight_key < :high)
+  {day}
+ORDER BY id DESC LIMIT :limit
+"""
+INDEXED_MATCHES = """
+SELECT {columns} FROM letters WHERE id IN (
+    SELECT id FROM letters WHERE name_key >= :low AND name_key < :high {day}
+    UNION SELECT id FROM letters WHERE cons_id_key >= :low AND cons_id_key < :high {day}
+    UNION SELECT id FROM letters WHERE flight_key >= :low AND flight_key < :high {day}
+)
+ORDER BY id DESC LIMIT :limit
+"""
+
+
+def _letter(row):
+    letter = dict(zip(("id",) + FIELDS, row))
+    letter["boxes"] = [tuple(box) for box in json.loads(letter["boxes"])]
+    letter["timings"] = json.loads(letter["timings"])
+    return letter
+
+
+class LetterHistory:
+    """ The generated letters, in a SQLite database at path. Usable from any
+    thread; calls are serialized. """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL: a record is one append to the log, and readers never wait for it
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._add_key_columns()
+        self._db.executescript(INDEXES)
+        self._db.commit()
+
+    def _add_key_columns(self):
+        # A database from before the case-folded columns gets them, filled in
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(letters)")}
+        missing = [key for key in KEY_COLUMNS if key not in columns]
+        if not missing:
+            return
+        for key in missing:
+            self._db.execute(f"ALTER TABLE letters ADD COLUMN {key} TEXT NOT NULL DEFAULT ''")
+        rows = self._db.execute(f"SELECT id, {', '.join(KEY_COLUMNS.values())} FROM letters").fetchall()
+        self._db.executemany(
+            f"UPDATE letters SET {', '.join(f'{key} = ?' for key in KEY_COLUMNS)} WHERE id = ?",
+            ([value.casefold() for value in values] + [letter_id] for letter_id, *values in rows),
+        )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def record(self, word_list, template, output_path, timings, created=None):
+        """ Add a letter filled from word_list with template (a CompiledTemplate);
+        returns its id """
+        created = time.time() if created is None else created
+        num_boxes = int(word_list[fill_engine.BOXES_INDEX])
+        boxes = [word_list[fill_engine.TAG_START_INDEX + 2 * i:fill_engine.TAG_START_INDEX + 2 * i + 2] for i in range(num_boxes)]
+        name, cons_id, flight = word_list[1], word_list[2], word_list[4]
+        columns = FIELDS + tuple(KEY_COLUMNS)
+        with self._lock, self._db:
+            self._db.execute("INSERT OR IGNORE INTO templates (sha256, data) VALUES (?, ?)", (template.sha256, template.data))
+            cursor = self._db.execute(
+                f"INSERT INTO letters ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                (created, datetime.date.fromtimestamp(created).isoformat(), word_list[0], name, cons_id, flight,
+                 json.dumps(boxes), os.path.abspath(template.path), template.sha256, output_path,
+                 json.dumps(timings), name.casefold(), cons_id.casefold(), flight.casefold()),
+            )
+            return cursor.lastrowid
+
+    def get(self, letter_id):
+        """ The letter with id letter_id, as a dict; None when there is none """
+        with self._lock:
+            row = self._db.execute(f"SELECT {COLUMNS} FROM letters WHERE id = ?", (letter_id,)).fetchone()
+        return None if row is None else _letter(row)
+
+    def find(self, query="", day=None, limit=FIND_LIMIT):
+        """ The latest letters whose name, consular ID or flight starts with
+        query, made on day (YYYY-MM-DD) if given, newest first """
+        query = query.strip().casefold()
+        # Compared with the case-folded columns, this range is every value
+        # starting with query, in any case
+        params = {"low": query, "high": query + "\U0010ffff", "day": day, "limit": limit, "scan": RECENT_SCAN}
+        with self._lock:
+            if not query:
+                where = "WHERE day = :day" if day else ""
+                rows = self._db.execute(f"SELECT {COLUMNS} FROM letters {where} ORDER BY id DESC LIMIT :limit", params).fetchall()
+            else:
+                day_condition = "AND day = :day" if day else ""
+                rows = self._db.execute(RECENT_MATCHES.format(columns=COLUMNS, day=day_condition), params).fetchall()
+                if len(rows) < limit:
+                    rows = self._db.execute(INDEXED_MATCHES.format(columns=COLUMNS, day=day_condition), params).fetchall()
+        return [_letter(row) for row in rows]
+
+    def template(self, letter):
+        """ The compiled template letter was made from: the file when it is
+        unchanged, else the copy kept in the history """
+        try:
+            compiled = fill_engine.template_cache.get(letter["template_path"])
+            if compiled.sha256 == letter["template_sha256"]:
+                return compiled
+        except OSError:
+            pass
+        with self._lock:
+            row = self._db.execute("SELECT data FROM templates WHERE sha256 = ?", (letter["template_sha256"],)).fetchone()
+        return fill_engine.CompiledTemplate(letter["template_path"], row[0])
+
+    def regenerate(self, letter_id, output_path=None, today=False):
+        """ Fill the letter again, into output_path or where it was first
+        written; returns the path written """
+        letter = self.get(letter_id)
+        if letter is None:
+            raise LookupError(f"No letter {letter_id} in the history")
+        word_list = fill_engine.make_word_list(letter["name"], letter["cons_id"], letter["flight"], letter["boxes"],
+                                               date=None if today else letter["date"])
+        output_path = output_path or letter["output_path"]
+        self.template(letter).render(word_list, output_path)
+        return output_path
+
+
+def describe(letter):
+    """ One line summing up a letter """
+    created = datetime.datetime.fromtimestamp(letter["created"]).strftime("%Y-%m-%d %H:%M")
+    boxes = len(letter["boxes"])
+    return f"{created}  {letter['name']}  {letter['cons_id']}  {letter['flight']}  ({boxes} box{'es' if boxes != 1 else ''})"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="document_filler history", description="Look up and regenerate generated letters.")
+    parser.add_argument("--db", default=DEFAULT_PATH, help="history database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    find = commands.add_parser("list", help="list the latest letters")
+    find.add_argument("query", nargs="?", default="", help="start of a name, consular ID or flight")
+    find.add_argument("--day", help="only letters made on this day (YYYY-MM-DD)")
+    find.add_argument("--limit", type=int, default=FIND_LIMIT, help=f"letters to list (default: {FIND_LIMIT})")
+    show = commands.add_parser("show", help="print a letter's inputs, template and timings")
+    show.add_argument("id", type=int)
+    regenerate = commands.add_parser("regenerate", help="fill a letter again")
+    regenerate.add_argument("id", type=int)
+    regenerate.add_argument("--out", help="where to write it (default: where it was first written)")
+    regenerate.add_argument("--today", action="store_true", help="date it today instead of its original date")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    history = LetterHistory(args.db)
+    try:
+        if args.command == "list":
+            for letter in history.find(args.query, args.day, args.limit):
+                print(f"{letter['id']:>6}  {describe(letter)}")
+        elif args.command == "show":
+            letter = history.get(args.id)
+            if letter is None:
+                print(f"No letter {args.id} in the history", file=sys.stderr)
+                return 1
+            print(json.dumps(letter, indent=2, ensure_ascii=False))
+        else:
+            try:
+                start = time.perf_counter()
+                path = history.regenerate(args.id, args.out, args.today)
+            except (LookupError, OSError, ValueError) as e:
+                print(f"Regeneration failed: {e}", file=sys.stderr)
+                return 1
+            print(f"Wrote {path} in {(time.perf_counter() - start) * 1000:.0f} ms")
+    finally:
+        history.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
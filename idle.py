@@ -0,0 +1,112 @@
+# Keeps the UI from waking the CPU while nobody is using it.
+#
+# Kivy only redraws the window when a canvas changed, but its loop still wakes
+# graphics/maxfps times a second to poll input and run the clock. After
+# IDLE_AFTER seconds without input, IdleThrottle slows the loop to IDLE_FPS;
+# the next mouse move, touch, key or dropped file restores full speed, so the
+# first input after a pause may wait up to 1 / IDLE_FPS seconds.
+#
+# IdleStats is the measurement mode (--idle-stats or
+# DOCUMENT_FILLER_IDLE_STATS=1): every STATS_INTERVAL seconds it logs the loop
+# wakeups and redraws per second and the CPU used by the process.
+#
+# Kivy is only imported inside the methods: document_filler imports this
+# module to take IDLE_STATS_FLAG off the command line before Kivy, which
+# rejects options it does not know, is first imported and parses it.
+import time
+
+IDLE_STATS_ENV = "DOCUMENT_FILLER_IDLE_STATS"
+IDLE_STATS_FLAG = "--idle-stats"
+
+IDLE_AFTER = 5
+IDLE_FPS = 5
+STATS_INTERVAL = 10
+
+
+class IdleThrottle:
+    """ Lowers the frame rate of the event loop while there is no input """
+
+    def __init__(self, window, idle_after=IDLE_AFTER, idle_fps=IDLE_FPS):
+        from kivy.clock import Clock
+
+        self.window = window
+        self.idle_after = idle_after
+        self.idle_fps = idle_fps
+        # Kivy has no public setter for the frame rate; the clock reads the
+        # private _max_fps before every sleep (checked against Kivy 2.3.1).
+        # Without it, the throttle is never installed.
+        self.supported = hasattr(Clock, "_max_fps")
+        self.active_fps = getattr(Clock, "_max_fps", 0)
+        self.idle = False
+        self.last_input = Clock.get_boottime()
+        self._check = Clock.create_trigger(self._go_idle, idle_after)
+
+    def install(self):
+        if not self.supported:
+            from kivy.logger import Logger
+
+            Logger.warning("Idle: this Kivy has no Clock._max_fps, the frame rate is not lowered when idle")
+            return
+        self.window.bind(
+            on_motion=self.on_input, on_mouse_pos=self.on_input,
+            on_key_down=self.on_input, on_drop_file=self.on_input,
+        )
+        self._check()
+
+    def on_input(self, *args):
+        from kivy.clock import Clock
+
+        self.last_input = Clock.get_boottime()
+        if self.idle:
+            self.idle = False
+            Clock._max_fps = self.active_fps
+        self._check()
+
+    def _go_idle(self, dt):
+        from kivy.clock import Clock
+
+        remaining = self.idle_after - (Clock.get_boottime() - self.last_input)
+        if remaining > 0:
+            Clock.schedule_once(self._go_idle, remaining)
+            return
+        self.idle = True
+        Clock._max_fps = self.idle_fps
+
+
+class IdleStats:
+    """ Logs wakeups, redraws and CPU use of the UI process """
+
+    def __init__(self, window, interval=STATS_INTERVAL):
+        self.window = window
+        self.interval = interval
+        self.redraws = 0
+
+    def start(self):
+        from kivy.clock import Clock
+
+        self.window.bind(on_flip=self._on_flip)
+        self._reset()
+        Clock.schedule_interval(self.report, self.interval)
+
+    def _on_flip(self, window):
+        self.redraws += 1
+
+    def _reset(self):
+        from kivy.clock import Clock
+
+        self.frames = Clock.frames
+        self.redraws = 0
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+
+    def report(self, dt):
+        from kivy.clock import Clock
+        from kivy.logger import Logger
+
+        elapsed = time.perf_counter() - self.wall
+        Logger.info(
+            f"Idle stats: {(Clock.frames - self.frames) / elapsed:.1f} wakeups/s, "
+            f"{self.redraws / elapsed:.1f} redraws/s, "
+            f"CPU {(time.process_time() - self.cpu) / elapsed * 100:.1f}%"
+        )
+        self._reset()
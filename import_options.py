@@ -0,0 +1,141 @@
+# Bulk import of dropdown options from text or CSV files.
+#
+#   document_filler import-options names.txt cons_ids.txt
+#   document_filler import-options roster.csv --list NAME_OPTIONS --column "Full name"
+#
+# A .txt file holds one option per line; a .csv file has a header row and the
+# options in --column (default: the first column). The list an input goes to
+# is --list, or else follows from the file name (names.txt -> NAME_OPTIONS,
+# see FILE_LISTS). Rows are streamed, so only the distinct values are held in
+# memory: every value has its whitespace collapsed and, for names, consular
+# IDs and flights, its case normalized, then empty values and values already
+# seen are skipped with one set lookup each. Every file is read before any
+# option is added, and everything imported in one run is saved with a single
+# snapshot write of the options file; a file that fails to read saves nothing.
+#
+# The app keeps its options in memory while it runs, so import from the
+# command line while the app is closed, or use Import File in the app.
+import argparse
+import csv
+import os
+import sys
+import time
+
+from options_store import DEFAULT_OPTIONS, DEFAULT_PATH, OptionsStore
+
+# File name (without extension) -> the list it fills
+FILE_LISTS = {
+    "names": "NAME_OPTIONS",
+    "cons_ids": "CONS_ID_OPTIONS",
+    "flights": "FLIGHT_OPTIONS",
+    "tags": "TAG_OPTIONS",
+    "descriptions": "DESC_OPTIONS",
+}
+
+# Case normalization per list; the others keep the case they are written in
+CASE = {
+    "NAME_OPTIONS": str.title,
+    "CONS_ID_OPTIONS": str.upper,
+    "FLIGHT_OPTIONS": str.upper,
+}
+
+
+def list_for_file(path):
+    """ The options list a file fills, judging by its name; None when unknown """
+    return FILE_LISTS.get(os.path.splitext(os.path.basename(path))[0].lower())
+
+
+def normalize(value, option_key):
+    value = " ".join(value.split())
+    case = CASE.get(option_key)
+    return case(value) if case else value
+
+
+def _read_rows(path, column=None):
+    # utf-8-sig: spreadsheets often save CSV with a byte order mark
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if not path.lower().endswith(".csv"):
+            yield from f
+            return
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if column is not None and column not in header:
+            raise ValueError(f"{path} has no column {column!r}")
+        index = header.index(column) if column is not None else 0
+        for row in reader:
+            if index < len(row):
+                yield row[index]
+
+
+def read_options(path, option_key, column=None, stats=None):
+    """ Stream the normalized values of a .txt or .csv file, each once. stats,
+    when given, is a dict whose "rows" entry counts the rows read. """
+    seen = set()
+    rows = 0
+    for raw in _read_rows(path, column):
+        rows += 1
+        value = normalize(raw, option_key)
+        if value and value not in seen:
+            seen.add(value)
+            yield value
+    if stats is not None:
+        stats["rows"] = stats.get("rows", 0) + rows
+
+
+def import_options(store, sources):
+    """ Add the options of every (path, option_key, column) source to the
+    store's model and save them once. Returns [(path, option_key, rows, added)]. """
+    # Every file is read before anything is added, so one that fails to read
+    # leaves the model, and the options file, as they were
+    read = []
+    for path, option_key, column in sources:
+        stats = {}
+        values = list(read_options(path, option_key, column, stats))
+        read.append((path, option_key, stats.get("rows", 0), values))
+    results = []
+    with store.batch() as model:
+        for path, option_key, rows, values in read:
+            results.append((path, option_key, rows, len(model.add_many(option_key, values))))
+    return results
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="document_filler import-options",
+                                     description="Add dropdown options in bulk from .txt or .csv files.")
+    parser.add_argument("files", nargs="+", help="files to import")
+    parser.add_argument("--list", choices=sorted(DEFAULT_OPTIONS),
+                        help="list to fill (default: judged from each file name)")
+    parser.add_argument("--column", help="CSV column holding the options (default: the first)")
+    parser.add_argument("--options", default=DEFAULT_PATH, help="options file to update")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    sources = []
+    for path in args.files:
+        option_key = args.list or list_for_file(path)
+        if option_key is None:
+            parser.error(f"cannot tell which list {path} fills; use --list")
+        sources.append((path, option_key, args.column))
+
+    start = time.perf_counter()
+    store = OptionsStore(args.options)
+    store.load()
+    try:
+        results = import_options(store, sources)
+    except (OSError, ValueError, csv.Error) as e:
+        print(f"Import failed, nothing was saved: {e}", file=sys.stderr)
+        return 1
+    for path, option_key, rows, added in results:
+        print(f"{path}: {rows} rows, {added} new in {option_key}")
+    if any(added for _, _, _, added in results):
+        print(f"Saved {args.options} in {time.perf_counter() - start:.2f} s")
+    else:
+        print("Nothing new to save")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
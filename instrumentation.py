@@ -0,0 +1,89 @@
+# Stage-level timing and memory spans for the fill pipeline.
+#
+# The engine wraps its stages (load, substitute, table, save) in span(); every
+# finished span is a dict passed to each registered hook:
+#
+#   {"stage": "save", "fill": 12, "template": "...", "start": 1718000000.1,
+#    "duration": 0.0007, "pid": 4242, "bytes_written": 40265,
+#    "peak_memory": 183321}            # peak_memory only while tracemalloc runs
+#
+# With no hooks registered a span costs a couple of attribute lookups.
+# JsonLinesExporter is the default hook; install_from_env() enables it when
+# DOCUMENT_FILLER_SPANS names a file (and traces memory when
+# DOCUMENT_FILLER_SPANS_MEMORY=1).
+import itertools
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+SPANS_ENV = "DOCUMENT_FILLER_SPANS"
+MEMORY_ENV = "DOCUMENT_FILLER_SPANS_MEMORY"
+
+_hooks = []
+_fill_ids = itertools.count(1)
+_env_exporter = None
+
+
+def add_hook(hook):
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def new_fill_id():
+    """ Identifier grouping the spans of one filled document """
+    return next(_fill_ids)
+
+
+@contextmanager
+def span(stage, **attributes):
+    """ Time the enclosed block; the yielded dict can be given extra fields
+    (bytes_read, bytes_written, rows, ...) before it is handed to the hooks """
+    if not _hooks:
+        yield {}
+        return
+    record = {"stage": stage, **attributes}
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    record["start"] = time.time()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["duration"] = time.perf_counter() - start
+        record["pid"] = os.getpid()
+        if tracing:
+            record["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        for hook in list(_hooks):
+            hook(record)
+
+
+class JsonLinesExporter:
+    """ Appends every span as one JSON line. The file is opened per span so
+    several processes can share it. """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def install_from_env():
+    """ Register a JsonLinesExporter for $DOCUMENT_FILLER_SPANS, once per process """
+    global _env_exporter
+    path = os.environ.get(SPANS_ENV)
+    if not path or _env_exporter is not None:
+        return _env_exporter
+    _env_exporter = JsonLinesExporter(path)
+    add_hook(_env_exporter)
+    if os.environ.get(MEMORY_ENV) == "1" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return _env_exporter
@@ -0,0 +1,134 @@
+# Type-ahead search over a dropdown option list.
+#
+# An OptionIndex is built once per option list and answers each keystroke
+# without looking at every option:
+#
+#   - prefix matches come from the case-folded options kept sorted, found
+#     with bisect;
+#   - substring matches come from a trigram index mapping every 3 character
+#     slice of an option to the sorted positions of the options containing
+#     it. A longer query walks the shortest posting list among its trigrams
+#     and checks each candidate. Posting lists for 1 and 2 character queries
+#     are built by one scan the first time they are asked for and kept,
+#     which keeps building the index to one pass over the trigrams.
+#
+# Results are prefix matches first, then the other substring matches, each
+# in alphabetical order, cut at the first `limit`.
+#
+# Options added after the build (add) are kept in a sorted side list that is
+# scanned on every search and merged into the results, so a new option costs
+# an insertion rather than a full rebuild. Once the side list passes
+# MERGE_AT, the owner should build a new index over everything, off the UI
+# thread, and swap it in.
+import heapq
+from array import array
+from bisect import bisect_left
+
+NGRAM = 3
+SEARCH_LIMIT = 100
+# Added options worth a rebuild: scanning this many adds about 0.5 ms to
+# every search
+MERGE_AT = 2000
+
+
+def _sort_key(option):
+    # Case-insensitive, ties broken by case so the order is always the same
+    return option.casefold(), option
+
+
+def _grams(key):
+    return {key[i:i + NGRAM] for i in range(len(key) - NGRAM + 1)}
+
+
+class OptionIndex:
+    """ Prefix and substring search over a fixed list of options """
+
+    def __init__(self, options=()):
+        values = sorted({str(option) for option in options}, key=_sort_key)
+        self.values = values
+        self.keys = [value.casefold() for value in values]
+        postings = {}
+        for position, key in enumerate(self.keys):
+            for gram in _grams(key):
+                postings.setdefault(gram, []).append(position)
+        self.postings = {gram: array("I", positions) for gram, positions in postings.items()}
+        # Options added since the build, as (case-folded, option), sorted
+        self.added = []
+
+    def __len__(self):
+        return len(self.values) + len(self.added)
+
+    def add(self, options):
+        """ Make options, none of them in the index yet, searchable without
+        rebuilding it """
+        self.added.extend((option.casefold(), option) for option in map(str, options))
+        self.added.sort()
+
+    def _prefix_range(self, key):
+        start = bisect_left(self.keys, key)
+        end = bisect_left(self.keys, key[:-1] + chr(ord(key[-1]) + 1), start)
+        return start, end
+
+    def _candidates(self, key):
+        """ Positions that may contain key, in order; None when none can """
+        if len(key) < NGRAM:
+            positions = self.postings.get(key)
+            if positions is None:
+                positions = array("I", [position for position, option in enumerate(self.keys) if key in option])
+                self.postings[key] = positions
+            return positions
+        shortest = None
+        for gram in _grams(key):
+            positions = self.postings.get(gram)
+            if not positions:
+                return None
+            if shortest is None or len(positions) < len(shortest):
+                shortest = positions
+        return shortest
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """ The first `limit` options matching query, prefix matches first """
+        key = query.strip().casefold()
+        prefix, other = self._search_built(key, limit)
+        if self.added:
+            added_prefix, added_other = self._search_added(key, limit)
+            prefix = list(heapq.merge(prefix, added_prefix, key=_sort_key))
+            other = list(heapq.merge(other, added_other, key=_sort_key))
+        return (prefix + other)[:limit]
+
+    def _search_built(self, key, limit):
+        """ (prefix matches, other matches) among the built options, at most
+        `limit` in all """
+        if not key:
+            return self.values[:limit], []
+        start, end = self._prefix_range(key)
+        prefix = self.values[start:min(end, start + limit)]
+        other = []
+        if len(prefix) == limit:
+            return prefix, other
+        candidates = self._candidates(key)
+        if candidates is None:
+            return prefix, other
+        keys = self.keys
+        for position in candidates:
+            if start <= position < end:
+                continue
+            if key in keys[position]:
+                other.append(self.values[position])
+                if len(prefix) + len(other) == limit:
+                    break
+        return prefix, other
+
+    def _search_added(self, key, limit):
+        """ (prefix matches, other matches) among the added options, at most
+        `limit` in all """
+        prefix = []
+        other = []
+        for folded, option in self.added:
+            if folded.startswith(key):
+                prefix.append(option)
+            elif key in folded and len(prefix) + len(other) < limit:
+                other.append(option)
+            if len(prefix) == limit:
+                break
+        return prefix, other[:limit - len(prefix)]
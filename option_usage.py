@@ -0,0 +1,163 @@
+# Usage ranking of the dropdown options.
+#
+# Every time a letter is generated, each option it used (its name, consular
+# ID, flight, tags and descriptions) counts one use. Uses decay with a
+# half-life of HALF_LIFE_DAYS, so what was used last week outranks what was
+# used a lot last year. Dropdowns list the used options first, by score, then
+# the others in their usual order; search results put matching used options
+# first.
+#
+# A use at time t is worth 2 ** ((t - EPOCH) / HALF_LIFE) rather than a count
+# decayed to the present: every score then shrinks by the same factor as time
+# passes, so the order of the options only changes when one is used, and the
+# ranking is kept sorted by moving that one option with bisect instead of
+# re-sorting. The worths grow without bound, so their logarithms are kept.
+#
+# Scores are saved next to the options file as
+#   {"NAME_OPTIONS": {"Fannan Mhamed": 12.3456, ...}, ...}
+# and options whose decayed count fell under MIN_COUNT are dropped on save.
+# Like the options store, it can be given a writer (an executor) to write the
+# file on, so the caller only pays for copying the scores.
+import json
+import math
+import os
+import time
+from bisect import bisect_left, insort
+
+from options_store import write_atomic, write_behind
+
+HALF_LIFE_DAYS = 30
+EPOCH = 1704067200  # 2024-01-01 UTC
+MIN_COUNT = 0.05
+
+_RATE = math.log(2) / (HALF_LIFE_DAYS * 86400)
+
+
+def _log_worth(when):
+    return (when - EPOCH) * _RATE
+
+
+def _log_add(a, b):
+    """ log(exp(a) + exp(b)) without overflow """
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def _write_scores(path, scores):
+    write_atomic(path, json.dumps(scores, separators=(",", ":"), ensure_ascii=False))
+
+
+class UsageRanking:
+    """ Decayed use counts of the options of one list, kept in score order """
+
+    def __init__(self, scores=None):
+        self.scores = dict(scores or {})
+        # (-score, option), so the best option comes first
+        self.ranked = sorted((-score, option) for option, score in self.scores.items())
+        self._keys = {}
+        self.version = 0
+
+    def __len__(self):
+        return len(self.ranked)
+
+    def use(self, option, when=None):
+        old = self.scores.get(option)
+        new = _log_add(old, _log_worth(time.time() if when is None else when))
+        if old is not None:
+            del self.ranked[bisect_left(self.ranked, (-old, option))]
+        insort(self.ranked, (-new, option))
+        self.scores[option] = new
+        self.version += 1
+
+    def count(self, option, when=None):
+        """ Decayed number of uses of option """
+        score = self.scores.get(option)
+        if score is None:
+            return 0.0
+        return math.exp(score - _log_worth(time.time() if when is None else when))
+
+    def top(self):
+        return [option for _, option in self.ranked]
+
+    def order(self, options):
+        """ options, the used ones first by score """
+        scores = self.scores
+        if not scores:
+            return options
+        return self.top() + [option for option in options if option not in scores]
+
+    def search(self, index, query, limit):
+        """ index.search(query, limit) with the used options matching query first """
+        key = query.strip().casefold()
+        keys = self._keys
+        matches = []
+        for _, option in self.ranked:
+            folded = keys.get(option)
+            if folded is None:
+                folded = keys[option] = option.casefold()
+            if key in folded:
+                matches.append(option)
+                if len(matches) == limit:
+                    return matches
+        if not matches:
+            return index.search(query, limit)
+        seen = set(matches)
+        for option in index.search(query, limit):
+            if option not in seen:
+                matches.append(option)
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def prune(self, when=None):
+        """ Forget the options used less than MIN_COUNT times, decayed """
+        floor = math.log(MIN_COUNT) + _log_worth(time.time() if when is None else when)
+        stale = [option for option, score in self.scores.items() if score < floor]
+        for option in stale:
+            del self.ranked[bisect_left(self.ranked, (-self.scores.pop(option), option))]
+            self._keys.pop(option, None)
+        if stale:
+            self.version += 1
+
+
+class OptionUsage:
+    """ The usage rankings of all option lists, saved to path """
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+        self.rankings = {}
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+            except ValueError:
+                saved = {}  # rankings are a convenience; start over rather than fail
+            self.rankings = {key: UsageRanking(scores) for key, scores in saved.items()}
+        return self
+
+    def ranking(self, key):
+        ranking = self.rankings.get(key)
+        if ranking is None:
+            ranking = self.rankings[key] = UsageRanking()
+        return ranking
+
+    def record(self, used, when=None):
+        """ Count one use of each option in used, {key: options}, and save """
+        when = time.time() if when is None else when
+        for key, options in used.items():
+            ranking = self.ranking(key)
+            for option in dict.fromkeys(options):
+                ranking.use(option, when)
+        self.save(when)
+
+    def save(self, when=None):
+        for ranking in self.rankings.values():
+            ranking.prune(when)
+        scores = {key: {option: round(score, 4) for option, score in ranking.scores.items()}
+                  for key, ranking in self.rankings.items() if ranking.scores}
+        write_behind(self.writer, _write_scores, self.path, scores)
@@ -0,0 +1,67 @@
+# Observable dropdown option lists.
+#
+# Every list carries a version that goes up each time the list changes.
+# Anything derived from a list (a dropdown's rows, a search index) remembers
+# the version it was built from and is rebuilt only when that version moves,
+# instead of being rebuilt or rebound on every change. Observers are called
+# with the key of the list that changed and the items added to it.
+#
+# A set per list mirrors its items, so checking for a duplicate is O(1).
+
+
+class OptionsModel:
+    """ Named option lists, each with a change counter """
+
+    def __init__(self, lists):
+        # dict.fromkeys drops duplicates and keeps the order
+        self._lists = {key: list(dict.fromkeys(values)) for key, values in lists.items()}
+        self._members = {key: set(values) for key, values in self._lists.items()}
+        self._versions = dict.fromkeys(self._lists, 0)
+        self._observers = []
+
+    def __contains__(self, key):
+        return key in self._lists
+
+    def __getitem__(self, key):
+        """ The list itself; change it only through add() or add_many() so its version follows """
+        return self._lists[key]
+
+    def keys(self):
+        return self._lists.keys()
+
+    def version(self, key):
+        return self._versions[key]
+
+    def has(self, key, item):
+        """ True when item is in the list named key """
+        return item in self._members[key]
+
+    def add(self, key, item):
+        """ Append item to the list named key; False when it is already there """
+        return bool(self.add_many(key, [item]))
+
+    def add_many(self, key, items):
+        """ Append the items not already in the list named key, as one change.
+        Returns the items added. """
+        values = self._lists[key]
+        members = self._members[key]
+        added = []
+        for item in items:
+            if item not in members:
+                members.add(item)
+                values.append(item)
+                added.append(item)
+        if added:
+            self._versions[key] += 1
+            for observer in list(self._observers):
+                observer(key, added)
+        return added
+
+    def bind(self, observer):
+        self._observers.append(observer)
+
+    def unbind(self, observer):
+        self._observers.remove(observer)
+
+    def as_dict(self):
+        return {key: list(values) for key, values in self._lists.items()}
@@ -0,0 +1,177 @@
+# Persistence for the dropdown options.
+#
+# The options live in two files:
+#
+#   dropdown_options.json          snapshot: {"NAME_OPTIONS": [...], ...}
+#   dropdown_options.json.journal  one {"key": ..., "item": ...} JSON line per
+#                                  item added since the snapshot
+#
+# An add appends (and fsyncs) its journal lines instead of rewriting every
+# list. Once COMPACT_AFTER items have been journaled, and when the store is
+# closed, the snapshot is rewritten and the journal emptied. Snapshots are
+# written to a temporary file and renamed over the old one, so a crash leaves
+# either the old or the new snapshot, never a half-written one. Replaying the
+# journal is idempotent, so a crash between the rename and emptying the
+# journal loses nothing; a torn last journal line is ignored, and the
+# snapshot rewritten at once so later appends do not land after it.
+#
+# Bulk changes made inside store.batch(), or between begin_batch() and
+# end_batch(), skip the journal and are persisted by a single snapshot write
+# when the batch ends.
+#
+# Given a writer (an executor with one thread), the store hands the journal
+# appends and snapshot writes to it, in order, so the caller never waits for
+# the disk; a change is then durable once its write has run. close() writes
+# directly, after the owner has shut the writer down.
+import json
+import logging
+import os
+from contextlib import contextmanager
+
+from options_model import OptionsModel
+
+COMPACT_AFTER = 1000
+
+# Where the app keeps its options, and what it starts with when there is none
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), "dropdown_options.json")
+DEFAULT_OPTIONS = {
+    'NAME_OPTIONS': ["Fannan Mhamed", "El Harbouj Mohammed", "Hassan Laarbi"],
+    'CONS_ID_OPTIONS': ["4966-7777-78", "4025-2450-53", "4028-5586-53"],
+    'FLIGHT_OPTIONS': ["AT201", "AT203"],
+    'TAG_OPTIONS': ["SPSM (Green label)", "Serveurs (Yellow label)", "1005 (white label)"],
+    'DESC_OPTIONS': [f"Diplomatic box# {j}" for j in list(range(1, 11)) + list(range(101, 111))]
+}
+
+
+def _append(path, data):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_snapshot(path, journal_path, lists):
+    write_atomic(path, json.dumps(lists, separators=(",", ":")))
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
+
+
+def write_atomic(path, data):
+    """ Replace the file at path with data, so a crash leaves the old or the
+    new content, never a mix """
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def write_behind(writer, function, *args):
+    """ Run function(*args) on writer, an executor, or right here when it is
+    None. A failure on the writer has nobody waiting for it, so it is logged. """
+    if writer is None:
+        function(*args)
+    else:
+        writer.submit(function, *args).add_done_callback(_log_failure)
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logging.getLogger(__name__).error(f"Error saving the options: {future.exception()!r}")
+
+
+class OptionsStore:
+    """ Loads an OptionsModel from its snapshot and journal, and records every
+    later change to it """
+
+    def __init__(self, path=DEFAULT_PATH, defaults=DEFAULT_OPTIONS):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.defaults = defaults
+        self.model = None
+        self.writer = None
+        self.journaled = 0
+        self._batching = False
+        self._batched = False
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                lists = json.load(f)
+        else:
+            lists = self.defaults
+        self.model = OptionsModel(lists)
+        self.journaled, complete = self._replay()
+        # Lines appended after a torn one would be lost with it, so a torn
+        # journal is folded into the snapshot straight away
+        if not os.path.exists(self.path) or not complete or self.journaled >= COMPACT_AFTER:
+            self.compact()
+        self.model.bind(self.record)
+        return self.model
+
+    def _replay(self):
+        """ Apply the journal to the model; returns the number of entries, and
+        False with it when the journal ends in a torn line """
+        if not os.path.exists(self.journal_path):
+            return 0, True
+        entries = 0
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    # Cut short if it lacks its newline, even when it parses
+                    if not line.endswith("\n"):
+                        raise ValueError(line)
+                    entry = json.loads(line)
+                except ValueError:
+                    return entries, False  # torn write at the end of the journal
+                if entry["key"] in self.model:
+                    self.model.add(entry["key"], entry["item"])
+                entries += 1
+        return entries, True
+
+    def record(self, key, added):
+        """ OptionsModel observer: journal the items added to the list named key """
+        if self._batching:
+            self._batched = True
+            return
+        lines = "".join(json.dumps({"key": key, "item": item}) + "\n" for item in added)
+        write_behind(self.writer, _append, self.journal_path, lines)
+        self.journaled += len(added)
+        if self.journaled >= COMPACT_AFTER:
+            self.compact()
+
+    def begin_batch(self):
+        """ Keep the changes from now on out of the journal until end_batch() """
+        self._batching = True
+
+    def end_batch(self):
+        """ Persist the changes made since begin_batch() as one new snapshot """
+        self._batching = False
+        changed, self._batched = self._batched, False
+        if changed:
+            self.compact()
+
+    @contextmanager
+    def batch(self):
+        """ Persist the changes made in the block once, as a new snapshot, when
+        it ends, also when it raises. If the process dies inside the block,
+        its changes are lost and the files are left as they were. """
+        self.begin_batch()
+        try:
+            yield self.model
+        finally:
+            self.end_batch()
+
+    def compact(self):
+        """ Write a fresh snapshot and empty the journal """
+        # The lists are copied here, so the writer serializes them as they are now
+        write_behind(self.writer, _write_snapshot, self.path, self.journal_path, self.model.as_dict())
+        self.journaled = 0
+
+    def close(self):
+        self.writer = None
+        if self.model is not None and (self.journaled or self._batched):
+            self._batching = self._batched = False
+            self.compact()
+
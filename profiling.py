@@ -0,0 +1,83 @@
+# On-demand profiling of a fill or a batch run.
+#
+# Enabled with --profile on the command line or DOCUMENT_FILLER_PROFILE=1 in
+# the environment. A profiled block writes two files next to its output:
+#
+#   <base>.prof           cProfile statistics (python -m pstats, snakeviz, ...)
+#   <base>.collapsed.txt  sampled stacks in collapsed format, one
+#                         "outer;inner;leaf count" line per stack, ready for
+#                         flamegraph.pl or speedscope
+#
+# The sampler is a thread reading the profiled thread's frame every
+# millisecond, so it needs nothing beyond the standard library.
+import cProfile
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_ENV = "DOCUMENT_FILLER_PROFILE"
+PROFILE_FLAG = "--profile"
+
+
+def requested(argv=None, flag=PROFILE_FLAG, env=PROFILE_ENV):
+    """ True when flag is in argv or the environment variable env is set to
+    anything but 0; flag and env default to --profile and
+    DOCUMENT_FILLER_PROFILE. The flag is removed from argv, since Kivy rejects
+    command-line options it does not know. """
+    if argv is not None and flag in argv:
+        argv.remove(flag)
+        return True
+    return os.environ.get(env, "") not in ("", "0")
+
+
+class StackSampler:
+    """ Counts the call stacks of one thread, sampled at a fixed interval """
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def write_collapsed(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profile(output_base):
+    """ Profile the enclosed block on the current thread and write
+    output_base + ".prof" and output_base + ".collapsed.txt" """
+    sampler = StackSampler(threading.get_ident())
+    profiler = cProfile.Profile()
+    sampler.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        sampler.stop()
+        profiler.dump_stats(output_base + ".prof")
+        sampler.write_collapsed(output_base + ".collapsed.txt")
@@ -0,0 +1,203 @@
+# Local HTTP render service: keeps compiled templates and worker processes warm
+# so a letter costs one render instead of a full application start.
+#
+#   document_filler serve --template filldoc.docx [--port 8765] [--workers 4]
+#
+#   POST /render  {"name": ..., "cons_id": ..., "flight": ..., "boxes": [...]}
+#                 -> the filled .docx
+#   POST /render  {"records": [{...}, {...}]}  -> a zip with one .docx per record
+#   GET  /health  -> JSON with the rejected request count, and the template
+#                    cache counters when rendering in-process (--workers 1)
+#
+# A record may name one of the served templates with "template" (its file
+# name); otherwise the first --template is used. Connections are kept alive,
+# and when more than workers + --max-queue requests are waiting the server
+# answers 503 with Retry-After instead of queueing without bound.
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import batch
+import docx_writer
+import fill_engine
+import instrumentation
+
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def _warm(template_paths):
+    # Runs in every worker process: import and compile everything up front
+    instrumentation.install_from_env()
+    for path in template_paths:
+        fill_engine.template_cache.get(path)
+
+
+def _ping():
+    return os.getpid()
+
+
+def _render(template_path, word_list, compresslevel):
+    return fill_engine.template_cache.get(template_path).render_bytes(word_list, compresslevel)
+
+
+class RenderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, template_paths, workers=1, max_queue=64,
+                 compresslevel=docx_writer.DEFAULT_COMPRESS_LEVEL, verbose=False):
+        super().__init__(address, RenderHandler)
+        self.templates = {os.path.basename(path): os.path.abspath(path) for path in template_paths}
+        self.default_template = os.path.abspath(template_paths[0])
+        self.compresslevel = compresslevel
+        self.verbose = verbose
+        _warm(self.templates.values())
+        self.in_process = workers <= 1
+        if not self.in_process:
+            self.executor = ProcessPoolExecutor(workers, initializer=_warm, initargs=(list(self.templates.values()),))
+            # Start every worker now rather than on the first requests
+            for future in [self.executor.submit(_ping) for _ in range(workers)]:
+                future.result()
+        else:
+            self.executor = ThreadPoolExecutor(1)
+        # Requests being rendered or waiting for a worker
+        self.slots = threading.BoundedSemaphore(workers + max_queue)
+        self.rejected = 0
+
+    def submit(self, record):
+        """ Start rendering record on a worker; returns the future of its bytes """
+        template = self.default_template
+        if "template" in record:
+            template = self.templates[record["template"]]
+        word_list = fill_engine.record_word_list(record)
+        return self.executor.submit(_render, template, word_list, self.compresslevel)
+
+    def render_all(self, records):
+        """ Render every record, spread over the workers; returns their bytes in order """
+        futures = []
+        try:
+            for record in records:
+                futures.append(self.submit(record))
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    # Headers and body are separate writes; without TCP_NODELAY the body waits
+    # for the client's delayed ACK (~40 ms on loopback)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_error(404)
+            return
+        stats = {"templates": sorted(self.server.templates), "rejected": self.server.rejected}
+        # With worker processes each has its own cache, which this process cannot see
+        if self.server.in_process:
+            stats["template_cache"] = fill_engine.template_cache.stats()
+        self._reply(200, "application/json", json.dumps(stats).encode("utf-8"))
+
+    def do_POST(self):
+        if self.path != "/render":
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            # The body cannot be skipped without its length
+            self.close_connection = True
+            self._reply(400, "text/plain", b"Invalid Content-Length\n")
+            return
+        body = self.rfile.read(length)
+        if not self.server.slots.acquire(blocking=False):
+            self.server.rejected += 1
+            self._reply(503, "text/plain", b"Render queue is full\n", {"Retry-After": "1"})
+            return
+        try:
+            payload = json.loads(body)
+            if isinstance(payload, dict) and "records" in payload:
+                records = payload["records"]
+                names = [batch.output_name(index, record) for index, record in enumerate(records, 1)]
+                buffer = io.BytesIO()
+                # The documents are already deflated, so the zip only stores them
+                with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+                    for name, data in zip(names, self.server.render_all(records)):
+                        archive.writestr(name, data)
+                self._reply(200, "application/zip", buffer.getvalue())
+            else:
+                name = batch.output_name(1, payload)
+                self._reply(200, DOCX_TYPE, self.server.render_all([payload])[0],
+                            {"Content-Disposition": f'attachment; filename="{name}"'})
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            # json.JSONDecodeError and fill_engine.TemplateError are ValueErrors
+            self._reply(400, "text/plain", f"Invalid shipment: {e!r}\n".encode("utf-8"))
+        except Exception as e:
+            # Not the client's fault (a template file gone, a worker process
+            # died, ...), but it still gets an answer
+            print(f"Render failed: {e!r}", file=sys.stderr)
+            self._reply(500, "text/plain", f"Render failed: {e!r}\n".encode("utf-8"))
+        finally:
+            self.server.slots.release()
+
+    def _reply(self, status, content_type, data, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="document_filler serve", description="Serve filled documents over HTTP.")
+    parser.add_argument("--template", action="append", required=True, help="template .docx to serve (repeatable)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="render processes (default: one per CPU)")
+    parser.add_argument("--max-queue", type=int, default=64, help="requests allowed to wait for a worker before 503")
+    parser.add_argument("--compress-level", type=int, default=docx_writer.DEFAULT_COMPRESS_LEVEL, choices=range(10),
+                        metavar="0-9", help="deflate level for the filled parts, 0 to store them uncompressed")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    parser.add_argument("--spans", help="append stage timing spans to this JSON lines file")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.spans:
+        os.environ[instrumentation.SPANS_ENV] = args.spans
+    instrumentation.install_from_env()
+    server = RenderServer((args.host, args.port), args.template, args.workers, args.max_queue,
+                          args.compress_level, args.verbose)
+    print(f"Serving {', '.join(server.templates)} on http://{args.host}:{server.server_address[1]}/render")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# Start-up timing of the UI, and a self-check enforcing a budget on it.
+#
+#   document_filler startup-check [--budget-ms 3000] [--report startup.json]
+#
+# The check launches the app (the packaged executable itself when frozen,
+# otherwise `python document_filler.py`) with DOCUMENT_FILLER_STARTUP_REPORT
+# naming a JSON file. The app marks each start-up stage with mark(), and when
+# its first frame is drawn writes the stages, the deferred modules already
+# loaded (there should be none) and the time of the frame to that file, then
+# quits. Time-to-first-frame is counted from the launch, so it includes the
+# interpreter start and, for a one-file executable, unpacking it. The check
+# fails when it is over the budget or a deferred module was loaded.
+#
+# Run from source, the child also runs with -X importtime and the slowest
+# imports of document_filler are listed; a frozen executable cannot do that,
+# so only its stages are reported.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPORT_ENV = "DOCUMENT_FILLER_STARTUP_REPORT"
+
+# Time-to-first-frame budget, in ms
+STARTUP_BUDGET_MS = 3000
+
+# Modules the UI only imports on first use; loading one of them before the
+# first frame means start-up pays for it again
+DEFERRED_MODULES = ("docx", "lxml", "fill_engine", "import_options", "history", "sqlite3", "kivy.uix.filechooser", "kivy.uix.popup", "kivy.uix.spinner")
+
+# How many of the slowest imports to list
+TOP_IMPORTS = 10
+
+_last = time.perf_counter()
+_stages = []
+
+
+def mark(stage):
+    """ End the current start-up stage, naming it stage """
+    global _last
+    now = time.perf_counter()
+    _stages.append((stage, now - _last))
+    _last = now
+
+
+def write_report(path):
+    """ Called on the first frame: write what start-up did to path """
+    report = {
+        "first_frame": time.time(),
+        "stages": [{"stage": stage, "ms": seconds * 1000} for stage, seconds in _stages],
+        "deferred_loaded": [name for name in DEFERRED_MODULES if name in sys.modules],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+
+def on_first_frame(window, callback):
+    """ Call callback() once, after the window has drawn its first frame """
+    def flipped(window):
+        window.unbind(on_flip=flipped)
+        callback()
+
+    window.bind(on_flip=flipped)
+
+
+def app_command():
+    if getattr(sys, "frozen", False):
+        return [sys.executable]
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "document_filler.py")
+    return [sys.executable, "-X", "importtime", script]
+
+
+def slowest_imports(importtime_output, count=TOP_IMPORTS):
+    """ The imports made directly by document_filler, slowest first, from
+    -X importtime output: [(module, ms)] """
+    imports = []
+    started = False
+    for line in importtime_output.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split("|")
+        if not line.startswith("import time:") or len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2]
+        # document_filler runs as __main__, so its own imports are the least
+        # indented ones after those of the interpreter start-up, which ends
+        # with site
+        if started and name[1:2] != " ":
+            imports.append((name.strip(), int(fields[1]) / 1000.0))
+        started = started or name.strip() == "site"
+    imports.sort(key=lambda item: item[1], reverse=True)
+    return imports[:count]
+
+
+def run_check(budget_ms=STARTUP_BUDGET_MS, report_path=None, timeout=120):
+    """ Launch the app, wait for its first frame and return the report, with
+    "time_to_first_frame_ms", "imports" and "budget_ms" added """
+    keep = report_path is not None
+    if not keep:
+        fd, report_path = tempfile.mkstemp(suffix=".json", prefix="startup-")
+        os.close(fd)
+    if os.path.exists(report_path):
+        os.remove(report_path)  # so a stale report is not taken for this run's
+    env = dict(os.environ, **{REPORT_ENV: report_path})
+    launched = time.time()
+    result = subprocess.run(app_command(), env=env, capture_output=True, text=True, timeout=timeout)
+    if not os.path.exists(report_path):
+        raise RuntimeError(f"The app exited with code {result.returncode} before drawing a frame")
+    with open(report_path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    report["time_to_first_frame_ms"] = (report["first_frame"] - launched) * 1000
+    report["imports"] = [{"module": name, "ms": ms} for name, ms in slowest_imports(result.stderr or "")]
+    report["budget_ms"] = budget_ms
+    if keep:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        os.remove(report_path)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="document_filler startup-check",
+                                     description="Time the start-up of the app and check it against a budget.")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS,
+                        help=f"time-to-first-frame budget (default: {STARTUP_BUDGET_MS})")
+    parser.add_argument("--report", help="also keep the JSON report in this file")
+    args = parser.parse_args(argv)
+
+    report = run_check(args.budget_ms, args.report)
+    print(f"Time to first frame: {report['time_to_first_frame_ms']:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    for stage in report["stages"]:
+        print(f"  {stage['stage']:<20} {stage['ms']:8.1f} ms")
+    if report["imports"]:
+        print("Slowest imports:")
+        for item in report["imports"]:
+            print(f"  {item['module']:<30} {item['ms']:8.1f} ms")
+    failed = False
+    if report["deferred_loaded"]:
+        print(f"Loaded before the first frame, should be deferred: {', '.join(report['deferred_loaded'])}")
+        failed = True
+    if report["time_to_first_frame_ms"] > args.budget_ms:
+        print("Over budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
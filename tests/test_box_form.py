@@ -0,0 +1,36 @@
+import random
+
+from box_form import FIELDS, BoxForm
+
+
+def count_missing(form):
+    return sum(1 for field in FIELDS for value in form.values[field] if not value)
+
+
+def test_complete_form():
+    form = BoxForm(2)
+    assert form.missing == 4 and not form.complete()
+    assert form.fill("tag", "SPSM") == 2
+    form.set("description", 0, "Diplomatic box# 1")
+    form.set("description", 1, "Diplomatic box# 2")
+    assert form.complete()
+    assert form.boxes() == [("SPSM", "Diplomatic box# 1"), ("SPSM", "Diplomatic box# 2")]
+    form.resize(3)
+    assert form.missing == 2 and not form.complete()
+    assert not BoxForm(0).complete()
+
+
+def test_missing_follows_random_edits():
+    rng = random.Random(19)
+    form = BoxForm(5)
+    for _ in range(2000):
+        action = rng.randrange(3)
+        value = rng.choice(["", "x", "y"])
+        if action == 0:
+            form.resize(rng.randint(0, 12))
+        elif action == 1 and len(form):
+            form.set(rng.choice(FIELDS), rng.randrange(len(form)), value)
+        else:
+            form.fill(rng.choice(FIELDS), value, rng.randint(-2, 14), rng.choice([None, rng.randint(-2, 14)]))
+        assert form.missing == count_missing(form)
+        assert len(form.values["tag"]) == len(form.values["description"]) == len(form)
@@ -0,0 +1,26 @@
+import io
+import os
+import zipfile
+
+import docx_writer
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "filldoc.docx")
+
+
+def test_write_package_round_trip():
+    with open(TEMPLATE, "rb") as f:
+        data = f.read()
+    with zipfile.ZipFile(io.BytesIO(data)) as original:
+        names = original.namelist()
+        styles = original.read("word/styles.xml")
+        body = original.read("word/document.xml").replace(b"ENVOI PREMIER RL", b"ENVOI DEUXIEME RL")
+    for compresslevel in (0, docx_writer.DEFAULT_COMPRESS_LEVEL, 9):
+        output = io.BytesIO()
+        written = docx_writer.write_package(data, output, {"word/document.xml": body}, compresslevel)
+        assert written == len(output.getvalue())
+        with zipfile.ZipFile(output) as package:
+            assert package.testzip() is None
+            assert package.namelist() == names
+            assert package.read("word/document.xml") == body
+            # Untouched parts are copied byte for byte
+            assert package.read("word/styles.xml") == styles
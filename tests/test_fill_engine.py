@@ -0,0 +1,124 @@
+import io
+import os
+
+import docx
+from docx.oxml.ns import qn
+
+import fill_engine
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "filldoc.docx")
+BOXES = [("SPSM (Green label)", "Diplomatic box# 1"), ("Serveurs (Yellow label)", "Diplomatic box# 2"),
+         ("1005 (white label)", "Diplomatic box# 3")]
+
+
+def word_list(boxes=BOXES, name="Hassan Laarbi"):
+    return fill_engine.make_word_list(name, "4966-7777-78", "AT201", boxes, date="May 01, 2024")
+
+
+def render(template, words):
+    return docx.Document(io.BytesIO(template.render_bytes(words)))
+
+
+def paragraphs(document):
+    return [paragraph.text for paragraph in document.paragraphs]
+
+
+def test_numbered_runs():
+    text = "\n".join(paragraphs(render(fill_engine.CompiledTemplate(TEMPLATE), word_list())))
+    assert "May 01, 2024" in text
+    assert "MR. Hassan Laarbi with Cons Id # 4966-7777-78 will be handing over 3 diplomatic boxes" in text
+    assert "flight AT201" in text
+
+
+def test_template_is_reusable():
+    # A render works on copies: the compiled template must not keep the values
+    template = fill_engine.CompiledTemplate(TEMPLATE)
+    render(template, word_list())
+    text = "\n".join(paragraphs(render(template, word_list(name="Fannan Mhamed"))))
+    assert "MR. Fannan Mhamed with" in text
+    assert "Hassan" not in text
+
+
+def named_template(tmp_path):
+    """ filldoc.docx with {key} placeholders: one split over three runs, one
+    repeated, and one in the header """
+    document = docx.Document(TEMPLATE)
+    split = document.add_paragraph()
+    for text in ("Dear {na", "me", "} of Paris"):
+        split.add_run(text)
+    document.add_paragraph("{cons_id} / {cons_id}, {boxes} ({box_count})")
+    document.sections[0].header.add_paragraph().add_run("Flight {flight} on {date}")
+    path = tmp_path / "named.docx"
+    document.save(path)
+    return str(path)
+
+
+def test_split_repeated_and_header_placeholders(tmp_path):
+    document = render(fill_engine.CompiledTemplate(named_template(tmp_path)), word_list())
+    assert "Dear Hassan Laarbi of Paris" in paragraphs(document)
+    assert "4966-7777-78 / 4966-7777-78, 3 diplomatic boxes (3)" in paragraphs(document)
+    assert "Flight AT201 on May 01, 2024" in paragraphs(document.sections[0].header)
+    # Word drops the edge spaces of a w:t (" of Paris") unless told to keep them
+    for t in document.element.iter(qn("w:t")):
+        if t.text and t.text != t.text.strip():
+            assert t.get(qn("xml:space")) == "preserve", t.text
+
+
+def box_rows(document):
+    # The first row is the template's own heading
+    return [tuple(cell.text for cell in row.cells[:2]) for row in document.tables[0].rows[1:]]
+
+
+def test_box_rows_in_order():
+    template = fill_engine.CompiledTemplate(TEMPLATE)
+    assert box_rows(render(template, word_list())) == BOXES
+    assert box_rows(render(template, word_list(BOXES[:1]))) == BOXES[:1]
+
+
+def test_no_boxes():
+    assert box_rows(render(fill_engine.CompiledTemplate(TEMPLATE), word_list([]))) == []
+
+
+def copy_template(tmp_path, name="template.docx"):
+    path = tmp_path / name
+    path.write_bytes(open(TEMPLATE, "rb").read())
+    return path
+
+
+def test_template_cache_reuses_until_content_changes(tmp_path):
+    cache = fill_engine.TemplateCache()
+    path = copy_template(tmp_path)
+    compiled = cache.get(path)
+    assert cache.get(path) is compiled
+    # Touched, same content: the hash keeps the compiled template
+    os.utime(path, ns=(0, 0))
+    assert cache.get(path) is compiled
+    # New content: recompiled
+    named = named_template(tmp_path)
+    path.write_bytes(open(named, "rb").read())
+    os.utime(path, ns=(1, 1))
+    recompiled = cache.get(path)
+    assert recompiled is not compiled
+    assert "Dear Hassan Laarbi of Paris" in paragraphs(render(recompiled, word_list()))
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 2, 1)
+    assert stats["bytes"] == recompiled.nbytes
+
+
+def test_template_cache_evicts_least_recently_used(tmp_path):
+    first, second, third = (copy_template(tmp_path, f"{n}.docx") for n in ("a", "b", "c"))
+    cache = fill_engine.TemplateCache(max_entries=2)
+    kept = cache.get(first)
+    cache.get(second)
+    cache.get(first)
+    cache.get(third)
+    assert cache.stats()["evictions"] == 1
+    assert cache.get(first) is kept
+    cache.get(second)
+    assert cache.stats()["misses"] == 4
+    # Over max_bytes, only the newest template stays
+    small = fill_engine.TemplateCache(max_bytes=1)
+    small.get(first)
+    newest = small.get(second)
+    assert small.stats()["entries"] == 1
+    assert small.stats()["bytes"] == newest.nbytes
@@ -0,0 +1,62 @@
+import sqlite3
+
+import fill_engine
+import history
+
+from test_fill_engine import TEMPLATE
+
+DAY = 24 * 3600
+
+
+def record(letters, name, cons_id="4966-7777-78", flight="AT201", created=1714550400.0):
+    word_list = fill_engine.make_word_list(name, cons_id, flight, [("SPSM", "Box 1")], date="May 01, 2024")
+    template = fill_engine.template_cache.get(TEMPLATE)
+    return letters.record(word_list, template, "out.docx", {"total": 0.1}, created=created)
+
+
+def names(found):
+    return [letter["name"] for letter in found]
+
+
+def test_find_ignores_case_beyond_ascii(tmp_path):
+    letters = history.LetterHistory(str(tmp_path / "history.sqlite3"))
+    record(letters, "ÉLodie Martin", flight="at201")
+    record(letters, "Hassan Laarbi", cons_id="ab-12", flight="RAM800")
+    assert names(letters.find("é")) == ["ÉLodie Martin"]
+    assert names(letters.find("éLOD")) == ["ÉLodie Martin"]
+    assert names(letters.find("AT2")) == ["ÉLodie Martin"]
+    assert names(letters.find("AB")) == ["Hassan Laarbi"]
+    assert names(letters.find("x")) == []
+    letters.close()
+
+
+def test_find_recent_and_indexed_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(history, "RECENT_SCAN", 10)
+    letters = history.LetterHistory(str(tmp_path / "history.sqlite3"))
+    old = record(letters, "Fannan Mhamed", created=1714550400.0 - 2 * DAY)
+    for i in range(30):
+        record(letters, f"Hassan {i}")
+    # Common: the newest letters fill the page from the recent scan
+    assert names(letters.find("hassan", limit=5)) == [f"Hassan {i}" for i in range(29, 24, -1)]
+    # Rare and older than the scan: found through the indexes
+    assert [letter["id"] for letter in letters.find("fan")] == [old]
+    assert len(letters.find("hassan")) == 30
+    assert names(letters.find("", day="2024-04-29")) == ["Fannan Mhamed"]
+    assert names(letters.find("has", day="2024-04-29")) == []
+    assert names(letters.find("fan", day="2024-05-01")) == []
+    letters.close()
+
+
+def test_old_database_gets_key_columns(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    letters = history.LetterHistory(path)
+    record(letters, "ÉLodie Martin")
+    letters.close()
+    db = sqlite3.connect(path)
+    for key in history.KEY_COLUMNS:
+        db.execute(f"DROP INDEX letters_{key}")
+        db.execute(f"ALTER TABLE letters DROP COLUMN {key}")
+    db.close()
+    letters = history.LetterHistory(path)
+    assert names(letters.find("élo")) == ["ÉLodie Martin"]
+    letters.close()
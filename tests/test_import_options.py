@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+import import_options
+from options_store import OptionsStore
+
+
+def test_values_are_normalized_and_deduplicated(tmp_path):
+    names = tmp_path / "names.txt"
+    names.write_text("alice  smith\nALICE SMITH\n\n  bob jones \nFannan Mhamed\n", encoding="utf-8")
+    roster = tmp_path / "roster.csv"
+    roster.write_text("\ufeffid,flight\n1,at201\n2, AT207\n3,at207\n", encoding="utf-8")
+
+    store = OptionsStore(str(tmp_path / "options.json"))
+    model = store.load()
+    results = import_options.import_options(store, [(str(names), "NAME_OPTIONS", None),
+                                                    (str(roster), "FLIGHT_OPTIONS", "flight")])
+    assert [(rows, added) for _, _, rows, added in results] == [(5, 2), (3, 1)]
+    assert model["NAME_OPTIONS"][-2:] == ["Alice Smith", "Bob Jones"]
+    assert model["FLIGHT_OPTIONS"].count("AT201") == 1
+    assert model["FLIGHT_OPTIONS"][-1] == "AT207"
+
+    # Saved with one snapshot, no journal
+    with open(store.path, encoding="utf-8") as f:
+        assert "AT207" in json.load(f)["FLIGHT_OPTIONS"]
+    assert not (tmp_path / "options.json.journal").exists()
+
+
+def test_failed_file_saves_nothing(tmp_path):
+    names = tmp_path / "names.txt"
+    names.write_text("Alice Smith\nBob Jones\n", encoding="utf-8")
+    flights = tmp_path / "flights.txt"
+    flights.write_bytes(b"AT209\n\xff\n")
+
+    store = OptionsStore(str(tmp_path / "options.json"))
+    model = store.load()
+    version = model.version("FLIGHT_OPTIONS")
+    with open(store.path, encoding="utf-8") as f:
+        before = f.read()
+    with pytest.raises(ValueError):
+        import_options.import_options(store, [(str(names), "NAME_OPTIONS", None),
+                                              (str(flights), "FLIGHT_OPTIONS", None)])
+    assert not model.has("NAME_OPTIONS", "Alice Smith")
+    assert not model.has("FLIGHT_OPTIONS", "AT209")
+    assert model.version("FLIGHT_OPTIONS") == version
+    with open(store.path, encoding="utf-8") as f:
+        assert f.read() == before
+
+
+def test_cli_reports_csv_errors(tmp_path, capsys):
+    roster = tmp_path / "tags.csv"
+    roster.write_text("tag\n" + "x" * 200_000 + "\n", encoding="utf-8")
+    assert import_options.main([str(roster), "--options", str(tmp_path / "options.json")]) == 1
+    assert "Import failed, nothing was saved" in capsys.readouterr().err
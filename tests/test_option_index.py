@@ -0,0 +1,33 @@
+import random
+
+from option_index import OptionIndex
+
+QUERIES = ["", "a", "Ab", "bca", "ABCA", "cc", "zz", "b a", "é", "Éa"]
+
+
+def random_options(rng, count):
+    return [" ".join("".join(rng.choice("abcAB cé") for _ in range(rng.randint(1, 6)))
+                     for _ in range(rng.randint(1, 2))) for _ in range(count)]
+
+
+def test_prefix_and_substring_matches():
+    index = OptionIndex(["Paris", "Casablanca", "Rabat", "Marseille"])
+    assert index.search("par") == ["Paris"]
+    assert index.search("a", 3) == ["Casablanca", "Marseille", "Paris"]
+    assert index.search("ab") == ["Casablanca", "Rabat"]
+    assert index.search("xyz") == []
+
+
+def test_added_options_merge_like_a_rebuild():
+    rng = random.Random(17)
+    for _ in range(20):
+        options = sorted(set(random_options(rng, 200)))
+        rng.shuffle(options)
+        split = rng.randint(0, len(options))
+        index = OptionIndex(options[:split])
+        index.add(options[split:])
+        rebuilt = OptionIndex(options)
+        assert len(index) == len(rebuilt)
+        for query in QUERIES + rng.sample(options, 5):
+            for limit in (1, 7, 100):
+                assert index.search(query, limit) == rebuilt.search(query, limit), (query, limit)
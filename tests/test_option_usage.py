@@ -0,0 +1,63 @@
+import random
+
+import option_usage
+from option_index import OptionIndex
+from option_usage import OptionUsage, UsageRanking
+
+DAY = 86400
+NOW = option_usage.EPOCH + 400 * DAY
+
+
+def test_ranked_stays_sorted_by_score():
+    rng = random.Random(0)
+    ranking = UsageRanking()
+    options = [f"Option {i}" for i in range(50)]
+    when = NOW
+    for _ in range(2000):
+        when += rng.randint(0, 3 * DAY)
+        ranking.use(rng.choice(options), when)
+        assert ranking.ranked == sorted((-score, option) for option, score in ranking.scores.items())
+    assert len(ranking) == len(ranking.scores)
+
+
+def test_recent_uses_outrank_old_ones():
+    ranking = UsageRanking()
+    for _ in range(4):
+        ranking.use("Last year", NOW - 365 * DAY)
+    ranking.use("Last week", NOW - 7 * DAY)
+    assert ranking.top() == ["Last week", "Last year"]
+    # A use is worth half as much after each half-life
+    assert abs(ranking.count("Last week", NOW) - 2 ** (-7 / option_usage.HALF_LIFE_DAYS)) < 1e-9
+
+
+def test_order_and_search_put_used_options_first():
+    options = ["Amine Omar", "Hassan Karim", "Hassan Laarbi", "Nadia Hassan"]
+    ranking = UsageRanking()
+    ranking.use("Nadia Hassan", NOW)
+    version = ranking.version
+    assert ranking.order(options) == ["Nadia Hassan", "Amine Omar", "Hassan Karim", "Hassan Laarbi"]
+    assert ranking.search(OptionIndex(options), "hassan", 3) == ["Nadia Hassan", "Hassan Karim", "Hassan Laarbi"]
+    assert ranking.search(OptionIndex(options), "amine", 3) == ["Amine Omar"]
+    assert ranking.version == version
+
+
+def test_prune_drops_faded_options():
+    ranking = UsageRanking()
+    ranking.use("Old", NOW - 365 * DAY)
+    ranking.use("New", NOW)
+    version = ranking.version
+    ranking.prune(NOW)
+    assert ranking.top() == ["New"]
+    assert ranking.ranked == [(-ranking.scores["New"], "New")]
+    assert ranking.version == version + 1
+
+
+def test_scores_round_trip(tmp_path):
+    path = str(tmp_path / "options.json.usage")
+    usage = OptionUsage(path).load()
+    usage.record({"NAME_OPTIONS": ["Hassan Laarbi", "Hassan Laarbi"], "TAG_OPTIONS": ["SPSM"]}, NOW)
+    usage.record({"NAME_OPTIONS": ["Fannan Mhamed"]}, NOW + DAY)
+    loaded = OptionUsage(path).load()
+    assert loaded.ranking("NAME_OPTIONS").top() == ["Fannan Mhamed", "Hassan Laarbi"]
+    # Each option counts once per letter
+    assert abs(loaded.ranking("TAG_OPTIONS").count("SPSM", NOW) - 1) < 1e-3
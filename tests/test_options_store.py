@@ -0,0 +1,23 @@
+import json
+
+from options_store import OptionsStore
+
+
+def test_journal_replay_stops_at_torn_line(tmp_path):
+    path = str(tmp_path / "options.json")
+    store = OptionsStore(path)
+    model = store.load()
+    model.add("NAME_OPTIONS", "Karim Amine")
+    model.add("FLIGHT_OPTIONS", "AT205")
+    # The process died in the middle of the next append
+    with open(store.journal_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"key": "NAME_OPTIONS", "item": "Nadia Omar"})[:20])
+
+    model = OptionsStore(path).load()
+    assert model.has("NAME_OPTIONS", "Karim Amine")
+    assert model.has("FLIGHT_OPTIONS", "AT205")
+    assert not any(item.startswith("Nadia") for item in model["NAME_OPTIONS"])
+
+    # Items added after the torn line survive the next load
+    model.add("NAME_OPTIONS", "Youssef Rachid")
+    assert OptionsStore(path).load().has("NAME_OPTIONS", "Youssef Rachid")